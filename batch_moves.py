@@ -0,0 +1,110 @@
+"""
+Moves applied to a Board in bulk with numpy, for the millions of moves of normalizing a
+big triangle (one at a time each move is a pivot_exists, a few membership tests and a
+remove and add, all in the interpreter).
+
+A batch is an int array of shape (k, 2, 2), move i being the dot at moves[i, 0] jumping
+to moves[i, 1]. Instead of doing the moves one after another we look at them as events:
+move i writes a 0 at its a and a 1 at its b at time i. Sorting the events by (cell, time),
+the value of any cell at any time is the last event on it before that time (or the board
+if there is none), so all the checks apply_move does can be done at once, and the board
+after the batch is the last event of every cell. Only the cells that end up different
+get changed in the Board, and there are much fewer of those than moves.
+"""
+
+import itertools
+import numpy as np
+import movelog
+
+# the kind (index in movelog.DIRS) of a move by (dx, dy) is KINDS[dx + 1, dy + 1], -1 if
+# it's not a move to a neighbour
+KINDS = np.full((3, 3), -1, dtype = np.int64)
+for k, d in enumerate(movelog.DIRS):
+    KINDS[d[0] + 1, d[1] + 1] = k
+# the move by DIRS[k] pivots around the dot at PIVOTS[k] from where it starts, like in
+# pivot_exists
+PIVOTS = np.array([(0, 1), (1, 0), (-1, 0), (-1, 1), (1, -1), (0, -1)], dtype = np.int64)
+
+# moves (a list of pairs of points like the normalization generator gives them) as a
+# batch, translated by corner
+def translate(moves, corner):
+    flat = itertools.chain.from_iterable(itertools.chain.from_iterable(moves))
+    # fromiter is a lot faster than np.array going through the nested tuples
+    moves = np.fromiter(flat, dtype = np.int64, count = 4*len(moves)).reshape(-1, 2, 2)
+    return moves + np.array([int(corner[0]), int(corner[1])])
+
+# at most this many cells in the box of a batch (or 16 per move if that's more), the
+# moves of a normalization are all close together anyway
+MAX_CELLS = 1 << 24
+
+# do the batch to the Board dots if every move is one that apply_move would do: a dot at
+# a moves to the empty b around a dot at the pivot. then returns True, otherwise the
+# board isn't touched and it returns False (a move to b that has a dot is fine for
+# apply_move, but those go one by one, and so do moves too spread out for one bitmap)
+def apply_moves(dots, moves):
+    if len(moves) == 0:
+        return True
+    if not hasattr(dots, "bitmap"):
+        return False
+    a = moves[:, 0]
+    b = moves[:, 1]
+    d = b - a
+    if np.abs(d).max() > 1:
+        return False
+    kinds = KINDS[d[:, 0] + 1, d[:, 1] + 1]
+    if (kinds < 0).any():
+        return False
+    pivots = a + PIVOTS[kinds]
+
+    # the board around the batch as one bitmap
+    pts = np.concatenate([a, b, pivots])
+    x0, y0 = (int(v) for v in pts.min(0))
+    x1, y1 = (int(v) for v in pts.max(0))
+    width = x1 - x0 + 1
+    if width*(y1 - y0 + 1) > max(MAX_CELLS, 16*len(moves)):
+        return False
+    origin = np.array([x0, y0])
+    def cells(p):
+        p = p - origin
+        return p[:, 1]*width + p[:, 0]
+    bits = np.frombuffer(dots.bitmap(x0, y0, x1, y1), dtype = np.uint8)
+
+    n = len(moves)
+    times = np.arange(n)
+    ca = cells(a)
+    cb = cells(b)
+    keys = np.concatenate([ca*n + times, cb*n + times])
+    values = np.concatenate([np.zeros(n, dtype = np.uint8), np.ones(n, dtype = np.uint8)])
+    order = np.argsort(keys)
+    keys = keys[order]
+    values = values[order]
+    event_cells = keys // n
+
+    # the value of cells c at times t, before the moves at t
+    def at(c, t):
+        i = np.searchsorted(keys, c*n + t) - 1
+        before = (i >= 0) & (event_cells[np.maximum(i, 0)] == c)
+        return np.where(before, values[np.maximum(i, 0)], bits[c])
+    if not (at(ca, times).all() and at(cells(pivots), times).all() and not at(cb, times).any()):
+        return False
+
+    last = np.r_[event_cells[1:] != event_cells[:-1], True]
+    changed = last & (values != bits[event_cells])
+    removed = event_cells[changed & (values == 0)]
+    added = event_cells[changed & (values == 1)]
+    for c in removed.tolist():
+        dots.remove((x0 + c % width, y0 + c // width))
+    for c in added.tolist():
+        dots.add((x0 + c % width, y0 + c // width))
+    return True
+
+# write the batch to a movelog.MoveLog, the same as log.move for each move
+def log_moves(log, moves):
+    if len(moves) == 0:
+        return
+    d = moves[:, 1] - moves[:, 0]
+    records = np.column_stack([KINDS[d[:, 0] + 1, d[:, 1] + 1], moves[:, 0]])
+    limits = np.iinfo(np.dtype(log.typecode))
+    if records.min() < limits.min or records.max() > limits.max:
+        raise OverflowError("move out of range of the log")
+    log.record_many(records.astype(log.typecode).tobytes(), len(moves))
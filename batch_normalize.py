@@ -0,0 +1,104 @@
+"""
+Normalize lots of boards at once, spread over a process pool.
+
+    python batch_normalize.py [-j workers] [--as-completed] file ...
+
+Each file has boards in the from_s format of triangle_core.py, one board per file
+or several separated by blank lines. For every board this prints its name (file, and
+the number of the board in the file if there's more than one), the number of moves, the
+time it took and its normal form (in the from_s format, rows separated by "/").
+
+The boards go to the workers and back packed as bits (see movelog.pack_dots), in
+chunks so that a worker isn't waiting for the pool for every little board. The boards
+are independent, so with enough of them this scales with the number of cores.
+"""
+
+import os
+import sys
+import time
+import concurrent.futures
+import triangle_core as core
+import movelog
+
+# normalize one board in a worker: returns its index, the packed normal form (None if
+# the board couldn't be normalized), the number of moves, the seconds it took and the
+# error if there was one
+def normalize_packed(job):
+    index, packed = job
+    start = time.perf_counter()
+    try:
+        moves, dots = core.normalize_dots_batched(set(movelog.unpack_dots(packed)))
+    except ValueError as e:
+        return index, None, 0, time.perf_counter() - start, str(e)
+    return index, movelog.pack_dots(dots), moves, time.perf_counter() - start, None
+
+def normalize_chunk(chunk):
+    return [normalize_packed(job) for job in chunk]
+
+# normalize the boards (strings in the from_s format) on a pool of that many workers
+# (all the cores by default). yields a dict for every board: index (in boards),
+# normal_form (from_s format, None if it failed), moves, seconds and error. they come
+# in the order of boards, or as they finish if ordered is False
+def normalize_many(boards, workers = None, ordered = True, chunksize = None):
+    jobs = [(i, movelog.pack_dots(core.from_s(s))) for i, s in enumerate(boards)]
+    if workers == None:
+        workers = os.cpu_count() or 1
+    if chunksize == None:
+        # a few chunks per worker, so the ones that finish early can take more
+        chunksize = max(1, len(jobs)//(4*workers))
+    chunks = [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+    # every worker imports numpy as it starts, so its first board doesn't pay for it
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer = core.load_batch_moves) as pool:
+        if ordered:
+            done = pool.map(normalize_chunk, chunks)
+        else:
+            futures = [pool.submit(normalize_chunk, c) for c in chunks]
+            done = (f.result() for f in concurrent.futures.as_completed(futures))
+        for results in done:
+            for index, packed, moves, seconds, error in results:
+                yield {"index": index,
+                       "normal_form": None if packed == None else core.to_s(set(movelog.unpack_dots(packed))),
+                       "moves": moves,
+                       "seconds": seconds,
+                       "error": error}
+
+# the boards in a file, and their names
+def read_boards(filename):
+    with open(filename) as f:
+        boards = [b.strip() for b in f.read().split("\n\n") if b.strip() != ""]
+    if len(boards) == 1:
+        return boards, [filename]
+    return boards, [f"{filename}:{i + 1}" for i in range(len(boards))]
+
+def main(args):
+    workers = None
+    ordered = True
+    files = []
+    while len(args) > 0:
+        a = args.pop(0)
+        if a == "-j":
+            workers = int(args.pop(0))
+        elif a == "--as-completed":
+            ordered = False
+        else:
+            files.append(a)
+    boards = []
+    names = []
+    for filename in files:
+        b, n = read_boards(filename)
+        boards.extend(b)
+        names.extend(n)
+
+    start = time.perf_counter()
+    total = 0
+    for r in normalize_many(boards, workers, ordered):
+        name = names[r["index"]]
+        if r["error"] != None:
+            print(f"{name}\terror: {r['error']}")
+            continue
+        total += r["moves"]
+        print(f"{name}\t{r['moves']}\t{r['seconds']:.3f}\t{r['normal_form'].replace(chr(10), '/')}")
+    print(f"{len(boards)} boards, {total} moves in {time.perf_counter() - start:.2f} s", file = sys.stderr)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,299 @@
+"""
+Benchmarks for the hot paths of triangle_core.py.
+
+    python bench.py [--quick] [--out bench_results.json] [--baseline bench_baseline.json]
+                    [--threshold 1.5] [--save-baseline] [benchmark ...]
+
+Every benchmark is timed for triangle sizes 10 to 1000 (10 to 100 with --quick) and
+the results go to a JSON file: for each "name/size" the number of ops, the seconds
+and the seconds per op (the best of a few runs, see REPEAT), and the time per op
+relative to a reference loop timed along with it. Then they're compared with the
+baseline, and anything that got more than threshold times slower per op (and relative
+to the reference) is reported (and the exit status is 1). --save-baseline makes these
+results the new baseline.
+With names of benchmarks (like calculate_line), only those are run.
+
+The big sizes would take forever to do completely (a rotation is about n^2 steps and
+a normalization about n^3 moves), so those benchmarks do a fixed number of ops and
+it's the time per op that matters.
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import platform
+import triangle_core as core
+
+SIZES = [10, 30, 100, 300, 1000]
+QUICK_SIZES = [10, 30, 100]
+# runs of a benchmark, the best one (per op) counts. one run is enough if it takes a
+# second. a run (see measure) calls the benchmark again and again until the timed
+# parts add up to MIN_TIME seconds, or it's been MAX_WALL seconds with the setup (which
+# is slow for the big ones), so the short ones aren't just noise
+REPEAT = 3
+MIN_TIME = 0.2
+MAX_WALL = 2
+
+# a board with the triangle of that size at (0, 0) filled randomly (with probability
+# density), and the line of the triangle at orientation ori black
+def board(n, ori = 0, density = 0.5, seed = 1):
+    rng = random.Random(seed)
+    dots = core.Board([(x, y) for x in range(n) for y in range(n - x) if rng.random() < density])
+    tri = core.make_triangle((0, 0), n, dots, ori)
+    dots.update(tri.current_line)
+    return dots, tri
+
+# the benchmarks take the size and return (number of ops, seconds). the setup isn't timed
+
+# the walk of a line, without the cache
+def bench_calculate_line(n):
+    tri = core.make_triangle((0, 0), n, set())
+    rng = random.Random(2)
+    oris = [core.rat(rng.randrange(3*n*n), n*n) for _ in range(200)]
+    start = time.perf_counter()
+    for o in oris:
+        tri.rasterize_line(o)
+    return len(oris), time.perf_counter() - start
+
+# lines from the cache: triangles all over turning to the same few orientations, on
+# all three sides
+def bench_line_cache(n):
+    core.line_cache.clear()
+    rng = random.Random(2)
+    tris = [core.make_triangle((rng.randrange(1000), rng.randrange(1000)), n, set()) for _ in range(20)]
+    oris = [side + core.rat(rng.randrange(n*n), n*n) for side in range(3) for _ in range(3)]
+    start = time.perf_counter()
+    for tri in tris:
+        for o in oris:
+            tri.calculate_line(o)
+    return len(tris)*len(oris), time.perf_counter() - start
+
+# the old bisection for the next orientation
+def bench_technical_binary_thing(n):
+    tri = core.make_triangle((0, 0), n, set())
+    count = 20
+    start = time.perf_counter()
+    for i in range(count):
+        tri.bisect_next_orientation(1)
+    return count, time.perf_counter() - start
+
+# making the whole schedule of a rotation by a third (not cached), per step of it
+def bench_sweep_schedule(n):
+    core.schedule_cache.clear()
+    start = time.perf_counter()
+    steps = len(core.sweep_schedule(n, 0, 1))
+    return max(steps, 1), time.perf_counter() - start
+
+# going through the schedule (made before, not as we go)
+def bench_calculate_next_orientation(n):
+    tri = core.make_triangle((0, 0), n, set())
+    tri.set_wanted_orientation(1)
+    len(tri.schedule)
+    count = 0
+    start = time.perf_counter()
+    while count < 2000 and tri.schedule.has_step(tri.schedule_pos):
+        tri.calculate_next_orientation()
+        count += 1
+    return max(count, 1), time.perf_counter() - start
+
+# steps of a rotation, one per call
+def bench_update_orientation(n):
+    tri = core.make_triangle((0, 0), n, set())
+    tri.set_wanted_orientation(1)
+    count = 0
+    start = time.perf_counter()
+    while count < 200 and not tri.reorientation_done():
+        tri.update_orientation(1)
+        count += 1
+    return count, time.perf_counter() - start
+
+# cutting a triangle that a merged one half covers
+def bench_merge_with_murderer(n):
+    dots, tri = board(n)
+    murderer = core.make_triangle((n//2, 0), n, dots)
+    start = time.perf_counter()
+    tri.merge_with_murderer(murderer)
+    return 1, time.perf_counter() - start
+
+def bench_apply_random(n):
+    dots, tri = board(n)
+    random.seed(3)
+    count = 20000
+    start = time.perf_counter()
+    for i in range(count):
+        core.apply_random(dots)
+    return count, time.perf_counter() - start
+
+# the FALL part of a normalization (the line at orientation 2 already), as far as it
+# goes in some number of moves
+def bench_normalization_generator(n):
+    dots, tri = board(n, 2)
+    tri.normalization_phase = core.FALL
+    tri.normalized = False
+    count = 0
+    start = time.perf_counter()
+    for ext in tri.normalization_generator():
+        if tri.normalization_done() or count >= 20000:
+            break
+        for k in ext:
+            core.apply_move(dots, tuple(core.vadd(tri.corners[0], a) for a in k))
+            count += 1
+    return max(count, 1), time.perf_counter() - start
+
+# the same in bulk: chunks of the FALL moves applied with batch_moves (needs numpy)
+def bench_normalization_batched(n):
+    dots, tri = board(n, 2)
+    tri.normalization_phase = core.FALL
+    tri.normalized = False
+    tri.normafun = tri.normalization_generator()
+    count = 0
+    start = time.perf_counter()
+    while not tri.normalization_done() and count < 20000:
+        moves = core.load_batch_moves().translate(tri.normalization_chunk(4096), tri.corners[0])
+        core.apply_moves(dots, moves)
+        count += len(moves)
+    return max(count, 1), time.perf_counter() - start
+
+BENCHMARKS = [
+    ("calculate_line", bench_calculate_line),
+    ("line_cache", bench_line_cache),
+    ("technical_binary_thing", bench_technical_binary_thing),
+    ("sweep_schedule", bench_sweep_schedule),
+    ("calculate_next_orientation", bench_calculate_next_orientation),
+    ("update_orientation", bench_update_orientation),
+    ("merge_with_murderer", bench_merge_with_murderer),
+    ("apply_random", bench_apply_random),
+    ("normalization_generator", bench_normalization_generator),
+]
+if core.load_batch_moves() != None:
+    BENCHMARKS.append(("normalization_batched", bench_normalization_batched))
+
+# the cpu here isn't always equally fast (other things running, its clock), for a
+# second or so at a time, and that's more than the threshold. so along with the calls
+# of a benchmark we also time this fixed bit of plain python, and the time per op
+# relative to it ("relative") is what tells a slow machine from slow code
+def reference():
+    start = time.perf_counter()
+    x = 0
+    for i in range(20000):
+        x += i & 7
+    return time.perf_counter() - start
+
+# one run of a benchmark: it's called for MIN_TIME seconds (see REPEAT) with the
+# reference between the calls. returns the (ops, seconds) of the fastest call per op,
+# and its time per op relative to the fastest reference. like timeit, without the
+# garbage collector (when it runs depends on everything allocated before)
+def measure(bench, n):
+    best = None
+    ref = None
+    total = 0
+    start = time.perf_counter()
+    gc.collect()
+    gc.disable()
+    try:
+        while total < MIN_TIME and time.perf_counter() - start < MAX_WALL:
+            r = reference()
+            if ref == None or r < ref:
+                ref = r
+            ops, seconds = bench(n)
+            if best == None or seconds/ops < best[1]/best[0]:
+                best = ops, seconds
+            total += seconds
+        ref = min(ref, reference())
+    finally:
+        gc.enable()
+    return best[0], best[1], best[1]/best[0]/ref
+
+# the runs of a benchmark are in separate passes over all of them, so they're spread
+# out in time and the best one is more likely from a time when the cpu was fast
+def run(sizes, names = None):
+    cases = [(name, bench, n) for name, bench in BENCHMARKS for n in sizes
+             if names == None or name in names]
+    best = {}
+    for r in range(REPEAT):
+        for name, bench, n in cases:
+            key = f"{name}/{n}"
+            if key in best and best[key][1] > 1:
+                continue
+            ops, seconds, relative = measure(bench, n)
+            if key not in best:
+                best[key] = ops, seconds, relative
+            else:
+                o, s, rel = best[key]
+                if seconds/ops < s/o:
+                    o, s = ops, seconds
+                best[key] = o, s, min(rel, relative)
+    results = {}
+    for name, bench, n in cases:
+        key = f"{name}/{n}"
+        ops, seconds, relative = best[key]
+        results[key] = {"ops": ops, "seconds": seconds, "per_op": seconds/ops, "relative": relative}
+        print(f"{name:28} {n:5} {ops:8} ops {seconds:9.4f} s {1e6*seconds/ops:12.2f} us/op", file = sys.stderr)
+    return results
+
+# the benchmarks that got more than threshold times slower than in the baseline, both
+# per op and relative to the reference (the cpu being slow for a while makes the first
+# go up, and the reference being a bit off the second, but not both at once), as
+# (key, baseline per op, per op now, how many times slower relative to the reference)
+def regressions(results, baseline, threshold):
+    slower = []
+    for key, r in results.items():
+        if key not in baseline:
+            continue
+        b = baseline[key]
+        if r["per_op"] > threshold*b["per_op"] and r["relative"] > threshold*b["relative"]:
+            slower.append((key, b["per_op"], r["per_op"], r["relative"]/b["relative"]))
+    return slower
+
+def main(args):
+    sizes = SIZES
+    out = "bench_results.json"
+    baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+    threshold = 1.5
+    save = False
+    names = None
+    while len(args) > 0:
+        a = args.pop(0)
+        if a == "--quick":
+            sizes = QUICK_SIZES
+        elif a == "--out":
+            out = args.pop(0)
+        elif a == "--baseline":
+            baseline_file = args.pop(0)
+        elif a == "--threshold":
+            threshold = float(args.pop(0))
+        elif a == "--save-baseline":
+            save = True
+        else:
+            names = (names or []) + [a]
+
+    results = run(sizes, names)
+    data = {"python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": results}
+    with open(out, "w") as f:
+        json.dump(data, f, indent = 1)
+
+    if save:
+        with open(baseline_file, "w") as f:
+            json.dump(data, f, indent = 1)
+        return 0
+    if not os.path.exists(baseline_file):
+        print(f"no baseline at {baseline_file}", file = sys.stderr)
+        return 0
+    with open(baseline_file) as f:
+        baseline = json.load(f)["results"]
+    slower = regressions(results, baseline, threshold)
+    for key, before, now, ratio in slower:
+        print(f"slower: {key} {1e6*before:.2f} -> {1e6*now:.2f} us/op ({ratio:.2f}x)")
+    if len(slower) > 0:
+        return 1
+    print(f"no regressions over {threshold}x against {baseline_file}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
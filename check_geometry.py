@@ -0,0 +1,89 @@
+"""
+Checks the fast line geometry of triangle_core.py against the original versions it
+replaced, which stay in triangle_core.py for this.
+
+    python check_geometry.py [--max-size 20] [--count 50] [--seed 1]
+
+For every triangle size up to max-size:
+
+- calculate_line (from the line cache) and rasterize_line have to give the same line
+  as calculate_line_fraction, at count random orientations and at the corners, with
+  the triangle at a random place.
+- a rotation by the sweep schedule, up by a third and down by a third, has to take
+  the same steps as the old bisection: at every step the line at next_orientation has
+  to be the line bisect_next_orientation finds, and the move has to turn the current
+  line into it.
+
+The first thing that doesn't match is printed, and the exit status is 1.
+"""
+
+import sys
+import random
+import triangle_core as core
+
+# the line at ori by calculate_line and rasterize_line against calculate_line_fraction
+def check_line(tri, ori):
+    wanted = tri.calculate_line_fraction(ori)
+    if tri.calculate_line(ori) != wanted:
+        return f"calculate_line at {ori}"
+    walk = tri.rasterize_line(ori)
+    if len(walk) != tri.size or set(walk) != wanted:
+        return f"rasterize_line at {ori}"
+    return None
+
+# the steps of a rotation from start to wanted against bisect_next_orientation
+def check_rotation(tri, start, wanted):
+    tri.set_orientation(core.rat(start))
+    tri.set_wanted_orientation(wanted)
+    while not tri.done:
+        if tri.calculate_line_fraction(tri.orientation) != tri.current_line:
+            return f"the line at {tri.orientation} from {start} to {wanted}"
+        found = tri.bisect_next_orientation(tri.schedule.inc)
+        line = tri.calculate_line_fraction(tri.next_orientation)
+        if tri.calculate_line_fraction(found) != line:
+            return f"the step from {tri.orientation} to {tri.next_orientation} from {start} to {wanted}"
+        a, b = tri.next_move
+        if tri.current_line - {a} | {b} != line:
+            return f"the move {a} -> {b} at {tri.orientation} from {start} to {wanted}"
+        tri.rotation_step()
+    return None
+
+def check(size, count, rng):
+    tri = core.make_triangle((rng.randrange(-100, 100), rng.randrange(-100, 100)), size, set())
+    oris = [core.rat(side) for side in range(3)]
+    oris += [core.rat(rng.randrange(3*size*size), size*size) for _ in range(count)]
+    for ori in oris:
+        error = check_line(tri, ori)
+        if error != None:
+            return error
+    if size == 1:
+        return None
+    return check_rotation(tri, 0, 1) or check_rotation(tri, 2, 1)
+
+def main(args):
+    max_size = 20
+    count = 50
+    seed = 1
+    while len(args) > 0:
+        a = args.pop(0)
+        if a == "--max-size":
+            max_size = int(args.pop(0))
+        elif a == "--count":
+            count = int(args.pop(0))
+        elif a == "--seed":
+            seed = int(args.pop(0))
+        else:
+            print(f"unknown argument {a}", file = sys.stderr)
+            return 2
+
+    rng = random.Random(seed)
+    for size in range(1, max_size + 1):
+        error = check(size, count, rng)
+        if error != None:
+            print(f"size {size}: {error} doesn't match")
+            return 1
+    print(f"sizes 1 to {max_size} match")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
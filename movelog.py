@@ -0,0 +1,277 @@
+"""
+A binary log of the moves of a game, dense enough for the ~10^8 moves of normalizing
+a size 500 triangle.
+
+The file is an 8 byte header (MAGIC, a version byte, and the typecode of the values,
+"h" for int16 or "i" for int32) and then records of three values (kind, x, y):
+
+    kind 0 - 5       a move of the dot at (x, y) by DIRS[kind] (that's all the moves
+                     there are, a dot moves to a neighbour)
+    START            a new board starts here (everything before is forgotten), its
+                     dots follow as DOT records
+    DOT              there's a dot at (x, y)
+    MERGE + 16*size  a merge into the triangle with btm-left corner (x, y) and that size
+    KILL + 16*size   a triangle like that gets cut
+    NORMALIZE + 16*size   a triangle like that gets normalized
+
+so a move is 6 bytes with int16 (12 with int32). MoveLogReader maps the file and reads
+the records straight out of the map, and Replay goes back and forth in it.
+"""
+
+import array
+import mmap
+import bisect
+
+MAGIC = b"TSML"
+VERSION = 1
+HEADER = 8
+
+DIRS = [(1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)]
+DIR_KIND = {d: k for k, d in enumerate(DIRS)}
+
+START = 8
+DOT = 9
+MERGE = 10
+KILL = 11
+NORMALIZE = 12
+
+MARKS = {MERGE: "merge", KILL: "kill", NORMALIZE: "normalize"}
+
+class MoveLog:
+    # records are buffered and written this many values at a time
+    BUFFER = 3*65536
+
+    # typecode "h" is half the size, but coordinates must fit in an int16 then (and
+    # sizes in 11 bits), or record raises OverflowError
+    def __init__(self, filename, typecode = "h"):
+        assert typecode in ("h", "i")
+        self.file = open(filename, "wb")
+        self.file.write(MAGIC + bytes([VERSION, ord(typecode)]) + bytes(HEADER - len(MAGIC) - 2))
+        self.typecode = typecode
+        self.buffer = array.array(typecode)
+        self.moves = 0
+
+    def record(self, kind, x, y):
+        self.buffer.append(kind)
+        self.buffer.append(int(x))
+        self.buffer.append(int(y))
+        if len(self.buffer) >= self.BUFFER:
+            self.flush()
+
+    # the board is now dots, whatever happened before
+    def start(self, dots):
+        self.record(START, 0, 0)
+        for d in dots:
+            self.record(DOT, d[0], d[1])
+
+    # a move (a, b) like apply_move takes
+    def move(self, m):
+        a, b = m[0], m[1]
+        self.record(DIR_KIND[(int(b[0] - a[0]), int(b[1] - a[1]))], a[0], a[1])
+        self.moves += 1
+
+    # records already packed: values is the bytes of (kind, x, y) triples in the
+    # typecode of the log, count of them moves (see batch_moves.log_moves)
+    def record_many(self, values, count):
+        self.buffer.frombytes(values)
+        self.moves += count
+        if len(self.buffer) >= self.BUFFER:
+            self.flush()
+
+    # op is MERGE, KILL or NORMALIZE, of the triangle tri
+    def mark(self, op, tri):
+        self.record(op + 16*tri.size, tri.corners[0][0], tri.corners[0][1])
+
+    def flush(self):
+        self.buffer.tofile(self.file)
+        self.buffer = array.array(self.typecode)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class MoveLogReader:
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            header = f.read(HEADER)
+            if len(header) < HEADER or header[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{filename} is not a move log")
+            if header[len(MAGIC)] != VERSION:
+                raise ValueError(f"{filename} is move log version {header[len(MAGIC)]}, not {VERSION}")
+            self.typecode = chr(header[len(MAGIC) + 1])
+            size = f.seek(0, 2)
+            if size == HEADER:
+                # can't map an empty file, and there's nothing to read anyway
+                self.map = None
+                self.values = memoryview(array.array(self.typecode))
+            else:
+                self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+                data = memoryview(self.map)[HEADER:]
+                # a log that was cut off in the middle of a record
+                data = data[:len(data) - len(data) % (3*array.array(self.typecode).itemsize)]
+                self.values = data.cast(self.typecode)
+
+    def __len__(self):
+        return len(self.values)//3
+
+    # the i'th record (kind, x, y)
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        v = self.values
+        return v[3*i], v[3*i + 1], v[3*i + 2]
+
+    # the records from the i'th on, as (kind, x, y)
+    def records(self, start = 0):
+        v = self.values
+        for i in range(3*start, len(v), 3):
+            yield v[i], v[i + 1], v[i + 2]
+
+    # the records decoded: ("move", a, b), ("start",), ("dot", p), or for the marks
+    # ("merge", corner, size) and so on
+    def events(self, start = 0):
+        for kind, x, y in self.records(start):
+            if kind < START:
+                d = DIRS[kind]
+                yield "move", (x, y), (x + d[0], y + d[1])
+            elif kind == START:
+                yield "start",
+            elif kind == DOT:
+                yield "dot", (x, y)
+            else:
+                yield MARKS[kind % 16], (x, y), kind // 16
+
+    # just the moves, as (a, b)
+    def moves(self, start = 0):
+        for kind, x, y in self.records(start):
+            if kind < START:
+                d = DIRS[kind]
+                yield (x, y), (x + d[0], y + d[1])
+
+    def close(self):
+        self.values.release()
+        if self.map != None:
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# a set of dots packed as a bitmap of their bounding box: (left, bottom, width, bits)
+def pack_dots(dots):
+    if len(dots) == 0:
+        return 0, 0, 0, b""
+    left = min(d[0] for d in dots)
+    bottom = min(d[1] for d in dots)
+    width = max(d[0] for d in dots) - left + 1
+    height = max(d[1] for d in dots) - bottom + 1
+    bits = bytearray((width*height + 7)//8)
+    for d in dots:
+        i = (d[1] - bottom)*width + d[0] - left
+        bits[i >> 3] |= 1 << (i & 7)
+    return left, bottom, width, bytes(bits)
+
+def unpack_dots(packed):
+    left, bottom, width, bits = packed
+    dots = []
+    for j, byte in enumerate(bits):
+        while byte:
+            low = byte & -byte
+            i = 8*j + low.bit_length() - 1
+            dots.append((left + i % width, bottom + i // width))
+            byte ^= low
+    return dots
+
+# plays a log on dots (a set, or anything with add, remove, clear and update like a
+# Board). position i is the board after the first i moves of the log (and the records
+# up to the next move, so a new board comes right after the last move of the old one).
+# when it's made we go through the whole log once and keep the board every interval
+# moves (a keyframe), so seek anywhere is a keyframe and at most interval moves
+class Replay:
+    def __init__(self, reader, dots, interval = 65536):
+        self.reader = reader
+        self.dots = dots
+        self.interval = interval
+        # keyframes: the move, the record of that move, and the packed board there
+        self.key_moves = []
+        self.key_records = []
+        self.key_boards = []
+        board = set()
+        moves = 0
+        for r, (kind, x, y) in enumerate(reader.records()):
+            if kind < START:
+                if moves % interval == 0:
+                    self.keyframe(moves, r, board)
+                apply_record(board, kind, x, y)
+                moves += 1
+            else:
+                apply_record(board, kind, x, y)
+        if moves % interval == 0:
+            self.keyframe(moves, len(reader), board)
+        self.moves = moves
+        self.pos = None
+        self.record = None
+        self.seek(0)
+
+    def keyframe(self, move, record, board):
+        self.key_moves.append(move)
+        self.key_records.append(record)
+        self.key_boards.append(pack_dots(board))
+
+    # go to position i (between 0 and self.moves)
+    def seek(self, i):
+        i = max(0, min(i, self.moves))
+        if self.pos == None or i < self.pos or i - self.pos > self.interval:
+            k = bisect.bisect_right(self.key_moves, i) - 1
+            self.dots.clear()
+            self.dots.update(unpack_dots(self.key_boards[k]))
+            self.pos = self.key_moves[k]
+            self.record = self.key_records[k]
+        while self.pos < i:
+            self.step()
+        # and the records that come before the next move
+        self.step(False)
+
+    # do the next move (and the records before it), returns it as (a, b) or None at
+    # the end. with move False, only do the records before the next move
+    def step(self, move = True):
+        reader = self.reader
+        n = len(reader)
+        while self.record < n:
+            kind, x, y = reader[self.record]
+            if kind < START:
+                if not move:
+                    return None
+                self.record += 1
+                self.pos += 1
+                apply_record(self.dots, kind, x, y)
+                d = DIRS[kind]
+                return (x, y), (x + d[0], y + d[1])
+            self.record += 1
+            apply_record(self.dots, kind, x, y)
+        return None
+
+# do a record to the dots: moves like apply_move (the dot at a jumps to b unless b has
+# a dot already), new boards and their dots. marks don't do anything
+def apply_record(dots, kind, x, y):
+    if kind < START:
+        d = DIRS[kind]
+        b = (x + d[0], y + d[1])
+        if b not in dots:
+            dots.remove((x, y))
+            dots.add(b)
+    elif kind == START:
+        dots.clear()
+    elif kind == DOT:
+        dots.add((x, y))
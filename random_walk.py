@@ -0,0 +1,126 @@
+"""
+Batched random solitaire steps with numpy, for when apply_random one step at a time
+is too slow (thousands of dots and lots of random steps per frame).
+
+The board is a 2d bool array. A step is the same as in apply_random: pick a random dot,
+a random unit triangle (in the (0,0), (1,0), (0,1) shape) that has it as a corner, and
+if the triangle has two dots, with probability 1/2 one of them moves to the empty corner
+(see RandomWalk.attempt). In a batch we only keep steps whose triangle has its
+btm-left corner (x, y) with x - y = c mod 3 for the same c. Two such triangles never
+share a point, so all the steps of a batch can be decided and done at once.
+"""
+
+import numpy as np
+
+TRI = np.array([(0, 0), (1, 0), (0, 1)])
+# the two corners of TRI other than the i'th one
+OTHERS = np.array([(1, 2), (0, 2), (0, 1)])
+
+class RandomWalk:
+    def __init__(self, dots, seed = None, batch = 4096):
+        self.rng = np.random.default_rng(seed)
+        self.batch = batch
+        pts = np.array([(int(d[0]), int(d[1])) for d in dots], dtype = np.int64).reshape(-1, 2)
+        if len(pts) == 0:
+            lo = hi = np.zeros(2, dtype = np.int64)
+        else:
+            lo = pts.min(0)
+            hi = pts.max(0)
+        # the grid always has a free border, so a triangle at a dot is inside it
+        self.margin = 8
+        self.origin = lo - self.margin
+        self.grid = np.zeros(hi - lo + 1 + 2*self.margin, dtype = bool)
+        self.grid[pts[:, 0] - self.origin[0], pts[:, 1] - self.origin[1]] = True
+        # the points dots moved from and to in attempt, in board coordinates
+        self.touched = []
+
+    # do steps random steps, returns how many of them actually moved a dot
+    def run(self, steps):
+        rng = self.rng
+        done = 0
+        moved = 0
+        while done < steps:
+            pts = np.argwhere(self.grid)
+            if len(pts) == 0:
+                break
+            # about a third of these have the right colour. more than one per dot and
+            # dots couldn't take a step in another colour in between, so it'd diffuse slower
+            count = min(3*(steps - done), self.batch, len(pts))
+            d = pts[rng.integers(len(pts), size = count)]
+            base = d - TRI[rng.integers(3, size = count)]
+            base = base[(base[:, 0] - base[:, 1]) % 3 == rng.integers(3)][:steps - done]
+
+            # the same triangle can come up more than once, the later ones go in later rounds
+            lin = base[:, 0]*self.grid.shape[1] + base[:, 1]
+            order = np.argsort(lin, kind = "stable")
+            lin = lin[order]
+            firsts = np.r_[0, np.flatnonzero(lin[1:] != lin[:-1]) + 1]
+            rank = np.empty(len(lin), dtype = np.int64)
+            rank[order] = np.arange(len(lin)) - np.repeat(firsts, np.diff(np.r_[firsts, len(lin)]))
+
+            new = []
+            for r in range(rank.max() + 1 if len(rank) else 0):
+                new.append(self.attempt(base[rank == r]))
+            done += len(base)
+            if new:
+                new = np.concatenate(new)
+                moved += len(new)
+                self.grow(new)
+        return moved
+
+    # one random step at each of these triangles (no two share a point). apply_random picks
+    # the dot first, but the chance of a move only depends on the triangle: if it has
+    # exactly two dots then with probability 1/2 one of them (uniformly) moves to the
+    # empty corner. dots only move inside their triangle, so the chance of picking a
+    # triangle stays the same for the whole batch. returns where dots moved to
+    def attempt(self, base):
+        rng = self.rng
+        corners = base[:, None, :] + TRI[None, :, :]
+        occ = self.grid[corners[:, :, 0], corners[:, :, 1]]
+        go = np.flatnonzero((occ.sum(1) == 2) & (rng.random(len(base)) < 0.5))
+        empty = np.argmin(occ[go], 1)
+        mover = OTHERS[empty, rng.integers(2, size = len(go))]
+        a = corners[go, mover]
+        b = corners[go, empty]
+        self.grid[a[:, 0], a[:, 1]] = False
+        self.grid[b[:, 0], b[:, 1]] = True
+        self.touched.append(np.concatenate([a, b]) + self.origin)
+        return b
+
+    # make room if some of the points are on the border of the grid
+    def grow(self, pts):
+        if len(pts) == 0:
+            return
+        w, h = self.grid.shape
+        lo = pts.min(0)
+        hi = pts.max(0)
+        if lo[0] > 0 and lo[1] > 0 and hi[0] < w - 1 and hi[1] < h - 1:
+            return
+        m = self.margin
+        self.grid = np.pad(self.grid, m)
+        self.origin = self.origin - m
+
+    def dots(self):
+        pts = np.argwhere(self.grid) + self.origin
+        return set(map(tuple, pts.tolist()))
+
+    # do steps random steps and the same to dots, which has to be what the walk was
+    # made from with the same changes as here. only the points that end up different
+    # are changed in dots
+    def apply(self, dots, steps):
+        self.touched = []
+        self.run(steps)
+        if len(self.touched) == 0:
+            return
+        pts = np.unique(np.concatenate(self.touched), axis = 0)
+        now = self.grid[pts[:, 0] - self.origin[0], pts[:, 1] - self.origin[1]]
+        for p, there in zip(map(tuple, pts.tolist()), now.tolist()):
+            if there and p not in dots:
+                dots.add(p)
+            elif not there and p in dots:
+                dots.remove(p)
+        self.touched = []
+
+# steps random steps on the set dots, in place
+def apply_random_steps(dots, steps, seed = None):
+    RandomWalk(dots, seed).apply(dots, steps)
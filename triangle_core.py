@@ -0,0 +1,1923 @@
+"""
+The game without the display: boards of dots, triangles and their lines, merging,
+cutting and normalizing, auto-play and the performance counters. It doesn't need
+pygame, so batch workers and command line tools can import just this.
+triangle_solitaire.py is the pygame front end on top of it.
+"""
+
+import random
+import sys
+import fractions
+rat = fractions.Fraction
+import math
+import numbers
+import heapq
+import functools
+import array
+import time
+import movelog
+import json
+
+"""
+Mostly internal details are discussed in these comments. See readme.txt for instructions for the user.
+
+I use the L-orientation in implementation, but when drawing we will move the top point
+instructions.txt so we have an equilateral grid.
+
+Objects:
+* dots: a set of elements of \Z^2 (a Board)
+* triangles: triangles (equilateral in \Delta-orientation) where we have built a 
+line. The triangle knows the orientation of the line, it's determined by a single
+rational point on the boundary. It also knows which dots are associated with the
+line, and they are _black_. A triangle can be endangered_, that's a bool. Also _invasive_.
+* dots not part of line of any triangle are _gray_
+
+Whenever a new triangle is formed (because two triangles join), we may get that
+some triangle intersects the new one. If such a triangle is entirely inside a newly
+formed triangle, it just turns gray immediately.
+
+Other such triangles are all marked as endangered and the new triangle is marked
+invasive. We cannot merge any triangles that are endangered or invasive, or 
+such that after the merge they would touch an endangered or invasive one.
+
+We can get rid of an endangered triangle T as follows, where U is invasive.
+If T has a corner inside U, then rotate its line so that that line starts
+from that corner, then turn everything in U gray and you are left with a smaller
+triangle in place of T. If U has a corner inside T, then put all dots of T
+on the side that goes through U, cutting T into two triangles.
+
+Finally, an invasive triangle becomes non-invasive once we remove the endangereds.
+
+In the implementation, we will use a PyGame loop and at all times we draw the situation.
+We have a current operation that's happening, which can be to merge or undanger an
+endangered. In each case, we want to rotate the line of some triangle to some
+other point. We will calculate the next orientation that changes something, and
+then we lerp toward that one...
+
+ORDERS: for vertices, btm-left = 0, top = 1, right = 2
+for lines, left, bottom, ne [sic]
+"""
+
+
+# the phases of a normalization
+ORIENT = 7
+FALL = 8
+
+MARGIN = 0.3
+
+# the moves of FALL that go in bulk at a time with batch_moves in headless
+# normalizations
+NORMALIZE_CHUNK = 65536
+
+# performance counters: calls of the functions in COUNTED ("calls/calculate_line";
+# "calls/calculate_next_orientation" are the steps of sweep schedules, plus one at the
+# end of each rotation), moves per kind of operation ("moves/merge", "moves/kill",
+# "moves/normalize") and seconds per state ("seconds/merge" and so on). off by default,
+# and then they cost nothing: enable() swaps counting versions of the functions in,
+# disable() puts the real ones back. the moves and seconds are added where "if
+# stats.enabled" is checked once per batch of moves or per frame
+class Stats:
+    # (class name or None for a module function, function name)
+    COUNTED = [("Triangle", "calculate_line"),
+               ("Triangle", "calculate_next_orientation"),
+               ("Triangle", "get_lines"),
+               (None, "line_intersection")]
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.originals = {}
+
+    def add(self, key, n = 1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def counting(self, f, key):
+        counters = self.counters
+        def counted(*args, **kwargs):
+            counters[key] = counters.get(key, 0) + 1
+            return f(*args, **kwargs)
+        return counted
+
+    # a module function is replaced in every module that has it, so the calls from
+    # modules that did from triangle_core import * are counted too
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for cls, name in self.COUNTED:
+            owner = globals()[cls] if cls != None else None
+            f = getattr(owner, name) if owner != None else globals()[name]
+            counted = self.counting(f, "calls/" + name)
+            self.originals[cls, name] = f, counted
+            if owner != None:
+                setattr(owner, name, counted)
+            else:
+                rebind(name, f, counted)
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for (cls, name), (f, counted) in self.originals.items():
+            if cls != None:
+                setattr(globals()[cls], name, f)
+            else:
+                rebind(name, counted, f)
+        self.originals = {}
+
+    def reset(self):
+        self.counters.clear()
+
+    # the moves (an iterable) counted as moves/kind, and the time it takes to go through
+    # them as seconds/kind. when we're off that's just moves
+    def moves(self, moves, kind):
+        if not self.enabled:
+            return moves
+        return self.counted_moves(moves, kind)
+
+    def counted_moves(self, moves, kind):
+        start = time.perf_counter()
+        n = 0
+        for m in moves:
+            n += 1
+            yield m
+        self.add("moves/" + kind, n)
+        self.add("seconds/" + kind, time.perf_counter() - start)
+
+    # with the counters of the line and schedule caches
+    def as_dict(self):
+        counters = dict(self.counters)
+        for k, v in line_cache.info().items():
+            counters["line_cache/" + k] = v
+        for k, v in schedule_cache.info().items():
+            counters["schedule_cache/" + k] = v
+        return dict(sorted(counters.items()))
+
+    def dump(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.as_dict(), f, indent = 1)
+
+    # for showing on the screen
+    def lines(self):
+        return [f"{k} = {v:.2f}" if isinstance(v, float) else f"{k} = {v}" for k, v in self.as_dict().items()]
+
+stats = Stats()
+
+# the global name in every loaded module where it's old, to new
+def rebind(name, old, new):
+    for module in list(sys.modules.values()):
+        if getattr(module, name, None) is old:
+            setattr(module, name, new)
+
+
+
+
+
+
+def from_s(s):
+    dots = set()
+    s = s.strip()
+    lines = s.split("\n")
+    y = len(lines)-1
+    for l in lines:
+        x = 0
+        for c in l:
+            if c == "1":
+                dots.add((x, y))
+            x += 1
+        y -= 1
+    return dots
+        
+    
+
+def vadd(a, b):
+    return a[0]+b[0], a[1]+b[1]
+
+def vsub(a, b):
+    return a[0]-b[0], a[1]-b[1]
+
+def dot(a, b):
+    return a[0]*b[0] + a[1]*b[1]
+
+def smul(s, v):
+    return s*v[0], s*v[1]
+
+def rotate_right(v):
+    return (v[1], -v[0])
+
+def rotate_left(v):
+    return (-v[1], v[0])
+
+# exact division for integers (and Fractions), the geometry below relies on that
+def div(p, q):
+    if isinstance(p, numbers.Rational) and isinstance(q, numbers.Rational):
+        return rat(p, q)
+    return p / q
+
+def sqrdist(u, v):
+    return (v[0]-u[0])**2 + (v[1]-u[1])**2
+
+def right_of_line(line, pos):
+    a = line[0]
+    b = line[1]
+    bma = vsub(b, a)
+    rel = vsub(pos, a)
+    return dot(rotate_right(bma), rel) >= 0
+
+def triangle_contains(triangle_as_lines, pos):
+    for line in triangle_as_lines:
+        if not right_of_line(line, pos):
+            #print("not tirhg", line, pos)
+            return False
+    return True
+
+def line_intersection(line1, line2):
+    #print(line1, line2, "impi")
+    a, b = line1
+    b = vsub(b, a)
+    if b == (0, 0):
+        raise Exception("o no")
+    c, d = line2
+    d = vsub(d, c)
+    """
+    line1 = a + tb
+    line2 = c + ud
+    
+    ax + t bx = cx + u dx
+    ay + t by = cy + u dy
+
+    ax (by/bx) + t by = (by/bx)(cx + u dx)
+    ay + t by = cy + u dy
+
+    ax (by/bx) - ay = (by/bx) cx + (by/bx) u dx - cy - u dy
+
+    ax (by/bx) - ay = (by/bx) cx - cy + u ((by/bx) dx - dy)
+
+    (ax (by/bx) - ay + cy - (by/bx) cx) / ((by/bx) dx - dy) = u
+
+    t = (cy + u dy - ay) / by
+    """
+    if b[0] != 0:
+        #b0 = b0
+        slope = div(b[1], b[0])
+        u = div(a[0] * slope - a[1] + c[1] - slope * c[0], slope * d[0] - d[1])
+        # t = (c[1] + u * d[1] - a[1]) / b[1]
+        # assert vadd(c, smul(u, d)) == vadd(a, smul(t, b))
+        return vadd(c, smul(u, d))
+    else:
+        line1 = rotate_right(line1[0]), rotate_right(line1[1])
+        line2 = rotate_right(line2[0]), rotate_right(line2[1])
+        inte = line_intersection(line1, line2)
+        #print("had to rot", inte)
+        return rotate_left(inte)
+
+# the board is cut into TILE x TILE tiles (TILE = 1 << TILE_SHIFT), and only the tiles
+# that have dots are kept, so it can be as big as you like as long as the dots are sparse
+TILE_SHIFT = 6
+TILE = 1 << TILE_SHIFT
+TILE_MASK = TILE - 1
+
+# the dots of the board, with integer coordinates. every tile with dots in it has a
+# bytearray bitmap (bits[tile], the cell of x, y is (y & TILE_MASK) << TILE_SHIFT |
+# (x & TILE_MASK)), and there's a list of the dots so we can pick a random one in O(1);
+# pos[tile] has the index in the list of the dot at each cell of the tile (32 bit ints,
+# so a tile is 20 KB with the bitmap). a tile goes away when its last dot does.
+# otherwise it works like the set of coordinate tuples we used to have
+class Board:
+    def __init__(self, dots = ()):
+        self.bits = {}
+        self.pos = {}
+        self.list = []
+        # if this is a list, every dot that is added or removed gets appended to it
+        # (the renderer uses it to know what to redraw)
+        self.changes = None
+        self.update(dots)
+
+    def __contains__(self, v):
+        bits = self.bits.get((v[0] >> TILE_SHIFT, v[1] >> TILE_SHIFT))
+        return bits != None and bits[(v[1] & TILE_MASK) << TILE_SHIFT | (v[0] & TILE_MASK)] == 1
+
+    def __len__(self):
+        return len(self.list)
+
+    def __iter__(self):
+        return iter(self.list)
+
+    def add(self, v):
+        tile = (v[0] >> TILE_SHIFT, v[1] >> TILE_SHIFT)
+        bits = self.bits.get(tile)
+        if bits == None:
+            bits = self.bits[tile] = bytearray(TILE*TILE)
+            self.pos[tile] = array.array('i', [-1])*(TILE*TILE)
+        i = (v[1] & TILE_MASK) << TILE_SHIFT | (v[0] & TILE_MASK)
+        if bits[i]:
+            return
+        bits[i] = 1
+        self.pos[tile][i] = len(self.list)
+        self.list.append(v)
+        if self.changes != None:
+            self.changes.append(v)
+
+    def remove(self, v):
+        tile = (v[0] >> TILE_SHIFT, v[1] >> TILE_SHIFT)
+        bits = self.bits.get(tile)
+        i = (v[1] & TILE_MASK) << TILE_SHIFT | (v[0] & TILE_MASK)
+        if bits == None or not bits[i]:
+            raise KeyError(v)
+        # move the last dot to where this one was in the list
+        pos = self.pos[tile]
+        k = pos[i]
+        last = self.list.pop()
+        if k < len(self.list):
+            self.list[k] = last
+            self.pos[(last[0] >> TILE_SHIFT, last[1] >> TILE_SHIFT)][(last[1] & TILE_MASK) << TILE_SHIFT | (last[0] & TILE_MASK)] = k
+        bits[i] = 0
+        pos[i] = -1
+        if bits.find(1) == -1:
+            del self.bits[tile]
+            del self.pos[tile]
+        if self.changes != None:
+            self.changes.append(v)
+
+    def discard(self, v):
+        if v in self:
+            self.remove(v)
+
+    def update(self, dots):
+        for d in dots:
+            self.add((int(d[0]), int(d[1])))
+
+    def clear(self):
+        self.bits = {}
+        self.pos = {}
+        if self.changes != None:
+            self.changes.extend(self.list)
+        self.list = []
+
+    def random_dot(self, rng = random):
+        return rng.choice(self.list)
+
+    # the tiles with dots that have cells with x0 <= x <= x1 and y0 <= y <= y1. looks
+    # at every tile position in there, or at every tile if there are fewer of those
+    def tiles_in(self, x0, y0, x1, y1):
+        tx0, ty0 = x0 >> TILE_SHIFT, y0 >> TILE_SHIFT
+        tx1, ty1 = x1 >> TILE_SHIFT, y1 >> TILE_SHIFT
+        if (tx1 - tx0 + 1)*(ty1 - ty0 + 1) > len(self.bits):
+            return [t for t in self.bits if tx0 <= t[0] <= tx1 and ty0 <= t[1] <= ty1]
+        return [(tx, ty) for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1) if (tx, ty) in self.bits]
+
+    # the dots with x0 <= x <= x1 and y0 <= y <= y1, scanning the bitmaps row by row
+    def in_rect(self, x0, y0, x1, y1):
+        found = []
+        for tile in self.tiles_in(x0, y0, x1, y1):
+            bits = self.bits[tile]
+            left = tile[0] << TILE_SHIFT
+            bottom = tile[1] << TILE_SHIFT
+            a = max(x0, left) - left
+            b = min(x1, left + TILE_MASK) - left
+            for y in range(max(y0, bottom), min(y1, bottom + TILE_MASK) + 1):
+                row = (y - bottom) << TILE_SHIFT
+                i = bits.find(1, row + a, row + b + 1)
+                while i != -1:
+                    found.append((left + i - row, y))
+                    i = bits.find(1, i + 1, row + b + 1)
+        return found
+
+    # the dots in the triangle with btm-left corner at corner and that size
+    def in_triangle(self, corner, size):
+        found = []
+        for y in range(corner[1], corner[1] + size):
+            right = corner[0] + size - 1 - (y - corner[1])
+            found.extend(self.in_rect(corner[0], y, right, y))
+        return found
+
+    # the rectangle x0 <= x <= x1, y0 <= y <= y1 as one bitmap, the cell of x, y at
+    # (y - y0)*(x1 - x0 + 1) + x - x0 (batch_moves looks at a whole batch of moves
+    # through this)
+    def bitmap(self, x0, y0, x1, y1):
+        width = x1 - x0 + 1
+        out = bytearray(width*(y1 - y0 + 1))
+        for tile in self.tiles_in(x0, y0, x1, y1):
+            bits = self.bits[tile]
+            left = tile[0] << TILE_SHIFT
+            bottom = tile[1] << TILE_SHIFT
+            a = max(x0, left)
+            b = min(x1, left + TILE_MASK) + 1
+            for y in range(max(y0, bottom), min(y1, bottom + TILE_MASK) + 1):
+                row = (y - bottom) << TILE_SHIFT
+                out[(y - y0)*width + a - x0 : (y - y0)*width + b - x0] = bits[row + a - left : row + b - left]
+        return out
+
+    # x0, y0, x1, y1 of the tiles that have dots, so all the dots are in there (None
+    # if there are none)
+    def tile_bounds(self):
+        if len(self.bits) == 0:
+            return None
+        tx = [t[0] for t in self.bits]
+        ty = [t[1] for t in self.bits]
+        return min(tx) << TILE_SHIFT, min(ty) << TILE_SHIFT, (max(tx) << TILE_SHIFT) + TILE_MASK, (max(ty) << TILE_SHIFT) + TILE_MASK
+
+def set_merge_orientations(tri1, tri2):
+    flip, side = tri1.neighbor_side(tri2)
+    if flip:
+        tri1, tri2 = tri2, tri1
+
+    # flipped so that tri2's corner is on a side of tri1
+
+    l = (tri1.corners[2 - side], tri2.corners[2 - side])
+    
+    if tri1.size > 1 and tri2.size > 1:
+    
+        # now, a corner of tri2 is on a side of tri1,
+        # and that side dictated by var side
+        # 2 - side is the corner point opposite side
+        tri1.set_merge_orientation_from_pt(side, line_intersection(tri1.get_lines()[side], l))
+        tri2.set_merge_orientation_from_pt(side, line_intersection(tri2.get_lines()[side], l))
+
+    elif tri1.size == 1 and tri2.size == 1:
+
+        assert tri1.corners[0] == tri1.corners[1] == tri1.corners[2]
+        assert tri2.corners[0] == tri2.corners[1] == tri2.corners[2]
+
+        pt1 = tri1.corners[0]
+        pt2 = tri2.corners[0]
+
+        if pt2 == vadd(pt1, (1, 0)) or pt1 == vadd(pt2, (1, 0)):
+            tri1.set_wanted_orientation(0)
+            tri2.set_wanted_orientation(0)
+        if pt2 == vadd(pt1, (1, -1)) or pt1 == vadd(pt2, (1, -1)):
+            tri1.set_wanted_orientation(1)
+            tri2.set_wanted_orientation(1)
+        if pt2 == vadd(pt1, (0, 1)) or pt1 == vadd(pt2, (0, 1)):
+            tri1.set_wanted_orientation(2)
+            tri2.set_wanted_orientation(2)
+
+    elif tri1.size > 1:
+        #print("heresy", side)
+        li = line_intersection(tri1.get_lines()[side], l)
+        #print("inter", li)
+        assert tri2.size == 1
+        tri1.set_merge_orientation_from_pt(side, li)
+        #print(tri1.wanted_orientation, tri1.corners[0])
+        tri2.set_wanted_orientation(tri1.wanted_orientation)
+        #print(tri2.wanted_orientation, tri2.corners[0])
+
+        #print(tri1.next_line)
+
+    elif tri2.size > 1:
+        assert tri1.size == 1
+        tri2.set_merge_orientation_from_pt(side, line_intersection(tri2.get_lines()[side], l))
+        tri1.set_wanted_orientation(tri2.wanted_orientation)
+
+    """
+    if side == 0:
+        l = (tri1.corners[2], tri2.corners[2])
+        tri1.set_merge_orientation_from_pt(0, line_intersection(tri1.get_lines(0), l))
+        tri2.set_merge_orientation_from_pt(0, line_intersection(tri2.get_lines(0), l))
+    elif side == 1:
+        l = (tri1.corners[1], tri2.corners[1])
+        tri1.set_merge_orientation_from_pt(1, line_intersection(tri1.get_lines(1), l))
+        tri2.set_merge_orientation_from_pt(1, line_intersection(tri2.get_lines(1), l))
+    """
+        
+
+class Triangle:
+    def __init__(self, v, dots):
+        self.dots = dots # this is so _in theory_ the triangle could be smart about points when there is excess
+        self.size = 1
+        self.current_line = set([v])
+        self.corners = [v, v, v]
+        # the line is determined by a number [0, 3), 0 1 2 mean left down ne,
+        # and remainder means dist of endpoint on that side, clockwise
+        self.set_orientation(rat(0, 1))
+        # self.wantedpoint = None
+        self.timer = 0
+
+    def get_lines(self, margin = 0):
+        half = rat(1, 2)
+        #print ("getting lines", margin)
+        left_line = vadd(self.corners[0], (-margin, -1)), vadd(self.corners[1], (-margin, 1))
+        ne_line = vadd(self.corners[1], (margin*half-1, margin*half+1)), vadd(self.corners[2], (margin*half+1, margin*half-1))
+        bottom_line = vadd(self.corners[2], (1, -margin)), vadd(self.corners[0], (-1, -margin))
+        #print(left_line, ne_line, bottom_line)
+        return left_line, bottom_line, ne_line
+
+    def contains(self, pos, margin = MARGIN):
+        lines = self.get_lines(margin)
+        return triangle_contains(lines, pos)
+
+    # contains for a lattice point, with integers only: the points of the triangle are
+    # x >= x0, y >= y0, x + y <= x0 + y0 + size - 1 for its corner (x0, y0)
+    def has_point(self, v):
+        x0, y0 = self.corners[0]
+        return v[0] >= x0 and v[1] >= y0 and v[0] + v[1] <= x0 + y0 + self.size - 1
+
+    # the dots in the triangle: just the cells inside it if the dots are a Board,
+    # otherwise we go through all of them
+    def dots_inside(self):
+        if hasattr(self.dots, "in_triangle"):
+            return self.dots.in_triangle(self.corners[0], self.size)
+        return [k for k in self.dots if self.has_point(k)]
+
+    # the triangles have a common point. they're both x >= x0, y >= y0, x + y <= x0 + y0 + size - 1
+    # for their corner (x0, y0), so that's the same as checking if one has a corner of the
+    # other, but without the Fractions of contains
+    def intersects(self, other):
+        (x1, y1), (x2, y2) = self.corners[0], other.corners[0]
+        return max(x1, x2) + max(y1, y2) <= min(x1 + y1 + self.size, x2 + y2 + other.size) - 1
+
+    def get_drawn_lines(self):
+        return [self.get_line_from_orientation(self.get_pretend_orientation())]
+
+    def get_thickened(self, margin):
+        if margin == 0 and self.size == 1:
+            return self.corners
+        #print(margin)
+        left_line, bottom_line, ne_line = self.get_lines(margin)
+        points = []
+        #print(left_line, #ne_line,
+            #sbottom_line)
+        points.append(line_intersection(left_line, bottom_line))
+        #print(points)
+        #ab = bbbb
+        points.append(line_intersection(left_line, ne_line))
+        points.append(line_intersection(ne_line, bottom_line))
+        return points
+
+    # calculate the dots that should be on here. the line only depends on the size and
+    # the orientation relative to the corners, so its shape comes from line_cache and
+    # just gets moved to where the triangle is
+    def calculate_line(self, ori):
+        ori = rat(ori) % 3
+        side = int(ori)
+        xs, ys = line_cache.get(self.size, ori - side)
+        x0, y0 = int(self.corners[0][0]), int(self.corners[0][1])
+        # the shape is the line on side 2, the others are it turned around the
+        # triangle (corner 0 to 2 to 1 to 0 for side 0, the other way for side 1).
+        # point i of the shape has x + y = i
+        if side == 2:
+            return set(zip(map(x0.__add__, xs), map(y0.__add__, ys)))
+        if side == 0:
+            return set(zip(map((x0 + self.size - 1).__sub__, range(self.size)), map(y0.__add__, xs)))
+        return set(zip(map(x0.__add__, ys), map((y0 + self.size - 1).__sub__, range(self.size))))
+
+    # calculate_line without the cache, the points in the order of the walk.
+    # this is calculate_line_fraction done in integers: we multiply the line direction
+    # by the denominator of the orientation and the grid by 20*size (the inverse of the
+    # epsilon), so every distance there becomes an integer cross product, and those we
+    # can also just update incrementally as we walk
+    def rasterize_line(self, ori):
+        ori = rat(ori) % 3
+        side = int(ori)
+        start, moves = side_walk(side)
+        startpoint = self.corners[start]
+
+        # q * (endpoint - startpoint) where endpoint = av + (p/q)(bv - av)
+        t = ori - side
+        p, q = t.numerator, t.denominator
+        a, b = side_to_endpoints_cw(side)
+        sx, sy = int(startpoint[0]), int(startpoint[1])
+        ax, ay = int(self.corners[a][0]), int(self.corners[a][1])
+        bx, by = int(self.corners[b][0]), int(self.corners[b][1])
+        lx = q*(ax - sx) + p*(bx - ax)
+        ly = q*(ay - sy) + p*(by - ay)
+
+        # projdist of v is abs(v[1]*lx - v[0]*ly), which is linear inside the abs
+        scale = 20*self.size
+        (m0x, m0y), (m1x, m1y) = moves
+        f0 = scale*(m0y*lx - m0x*ly)
+        f1 = scale*(m1y*lx - m1x*ly)
+        fright = (m1y - m0y)*lx - (m1x - m0x)*ly
+        acc = 0 # scale * cross product of currpoint - startpoint
+
+        x, y = sx, sy
+        linepoints = [(x, y)]
+        for neps in range(self.size - 2, -1, -1):
+            base = acc + neps*fright
+            if abs(base + f0) <= abs(base + f1):
+                acc += f0
+                x += m0x
+                y += m0y
+            else:
+                acc += f1
+                x += m1x
+                y += m1y
+            linepoints.append((x, y))
+
+        return linepoints
+
+    # the original Fraction version of calculate_line, check_geometry.py checks the one
+    # above and rasterize_line against it
+    def calculate_line_fraction(self, ori):
+        #print(ori)
+        ori = ori % 3
+
+        # now we start at startpoint, and
+        # we do moves in order, as continuation take the one
+        # that is closer to line determined by ori
+        
+        side = int(ori)
+        if side == 0:
+            startpoint = self.corners[2]
+            moves = [(-1, 0), (-1, 1)]
+        if side == 1:
+            startpoint = self.corners[1]
+            moves = [(1, -1), (0, -1)]
+        if side == 2:
+            startpoint = self.corners[0]
+            moves = [(0, 1), (1, 0)]
+
+        # we need to distort the grid a little
+        right_move = vsub(moves[1], moves[0])
+        #print("size,2", self.size, right_move)
+        right_epsilon = smul(rat(1,20*self.size), right_move) # smul(rat(1,345987345*self.size), right_move)
+
+        #lerpo = ori - side
+        #a, b = side_to_endpoints_cw(side)
+        #av, bv = self.corners[a], self.corners[b]
+
+        # the line we actually want goes from startpoint to...
+        endpoint = self.point_from_orientation(ori)
+        #print(endpoint)
+        
+        # calculate length of projection on its complement (up to random order-preserving stretch)
+        def projdist(v):
+            # obviously we should just calc these once but it doesn't _really_ matter, and it's clearer this way maybe
+            relline = vsub(endpoint, startpoint) 
+            relv = vsub(v, startpoint)
+            rotline = rotate_left(relline)
+            return abs(dot(relv, rotline))
+
+        linepoints = []
+        currpoint = startpoint
+        linepoints.append(currpoint)
+        # currpoint = vadd(startpoint, (rat(1010010101,24359873489573248),rat(974984353,194875394275934857)))        
+
+        for i in range(self.size - 1):
+
+            neps = self.size - 2 - i
+            
+            dists = []
+            for m in moves:
+                p = vadd(vadd(currpoint, m), smul(neps, right_epsilon))
+                dists.append(projdist(p))
+            if dists[0] <= dists[1]:
+                currpoint = vadd(currpoint, moves[0])
+            else:
+                currpoint = vadd(currpoint, moves[1])
+                
+            linepoints.append(currpoint)
+
+        return set(linepoints)
+
+    def point_from_orientation(self, ori):
+        side = int(ori)
+        a, b = side_to_endpoints_cw(side)
+        av, bv = self.corners[a], self.corners[b]
+        t = ori - side
+        return vadd(av, smul(t, vsub(bv, av)))
+
+    def get_line_from_orientation(self, ori):
+        pt = self.point_from_orientation(ori)
+        side = int(ori)
+        return self.corners[2 - side], pt
+        
+    # given another triangle, are we buddies?
+    def neighbor_side(self, other, flip = False):
+        # is it on the left?
+        if other.corners[2][0] == self.corners[0][0] - 1 and other.corners[2][1] >= self.corners[0][1] and other.corners[2][1] <= self.corners[1][1] + 1:
+            return (flip, 0)
+        # btm?
+        if other.corners[1][1] == self.corners[0][1] - 1 and other.corners[1][0] >= self.corners[0][0] and other.corners[1][0] <= self.corners[2][0] + 1:
+            return (flip, 1)
+        # is it on the ne?
+        if sum(other.corners[0]) == sum(self.corners[1]) + 1 and other.corners[0][0] >= self.corners[1][0] and other.corners[0][1] >= self.corners[2][1]:
+            return (flip, 2)
+        if flip == True:
+            return None
+        else:
+            return other.neighbor_side(self, True)
+
+    def is_neighbor(self, other):
+        return self.neighbor_side(other) != None
+
+    def die(self, other):
+        #print(self.corners[0], "dije")
+        #print(other.corners[0])
+        c0 = self.corners[0]
+        c1 = self.corners[1]
+        c2 = self.corners[2]
+        if other.contains(c0) and other.contains(c1) and other.contains(c2):
+            self.set_wanted_orientation(self.orientation)
+        elif other.contains(c0):
+            self.set_wanted_orientation(2) # or 0
+        elif other.contains(c1):
+            self.set_wanted_orientation(1) # or 2
+        elif other.contains(c2):
+            self.set_wanted_orientation(0) # or 1
+        elif self.contains(other.corners[0]):
+            self.set_wanted_orientation(1)
+        elif self.contains(other.corners[1]):
+            self.set_wanted_orientation(0)
+        elif self.contains(other.corners[2]):
+            self.set_wanted_orientation(2)
+
+    def merge_with_murderer(self, murderer):
+        containeds = set()
+        minix = None
+        miniy = None
+        maxix = None
+        maxiy = None
+        for c in self.current_line:
+            if not murderer.has_point(c):
+                continue
+            if minix == None or c[0] < minix:
+                minix = c[0]
+            if maxix == None or c[0] > maxix:
+                maxix = c[0]
+            if miniy == None or c[1] < miniy:
+                miniy = c[1]
+            if maxiy == None or c[1] > maxiy:
+                maxiy = c[1]
+        if minix == None:
+            return []
+
+        dems = []
+        
+        if self.orientation == 0:
+            #print("this")
+            # in this case, we can look at minix, maxix
+            if minix > self.corners[0][0]: # there is a leftmost triangle to construct
+                #print("yep", minix, self.corners[0])
+                left = Triangle((0, 0), self.dots)
+                left.corners = self.corners[:]
+                left.size = int(minix - self.corners[0][0])
+                left.calculate_corners_from_one(0)
+                #print(left.corners, "issu")
+                #print(left.size)
+                #print("I FAILE NOW")
+                left.calculate_line(0)
+                dems.append(left)
+
+            if maxix < self.corners[2][0]:
+                #print("yeb", maxix, self.corners[2])
+                right = Triangle((0, 0), self.dots)
+                right.corners = self.corners[:]
+                right.size = int(self.corners[2][0] - maxix)
+                right.calculate_corners_from_one(2)
+                #print(right.corners, "rittus")
+                dems.append(right)
+
+        if self.orientation == 1:
+            # in this case, we can look at minix, maxix
+            if minix > self.corners[1][0]: # there is a leftmost triangle to construct
+                left = Triangle((0, 0), self.dots)
+                left.corners = self.corners[:]
+                left.size = int(minix - self.corners[1][0])
+                left.calculate_corners_from_one(1)
+                dems.append(left)
+
+            if maxix < self.corners[2][0]:
+                right = Triangle((0, 0), self.dots)
+                right.corners = self.corners[:]
+                right.size = int(self.corners[2][0] - maxix)
+                right.calculate_corners_from_one(2)
+                dems.append(right)
+
+        if self.orientation == 2:
+            # in this case, we can look at minix, maxix
+            if miniy > self.corners[0][1]: # there is a btmmost triangle to construct
+                left = Triangle((0, 0), self.dots)
+                left.corners = self.corners[:]
+                left.size = int(miniy - self.corners[0][1])
+                left.calculate_corners_from_one(0)
+                dems.append(left)
+
+            if maxiy < self.corners[1][1]:
+                right = Triangle((0, 0), self.dots)
+                right.corners = self.corners[:]
+                right.size = int(self.corners[1][1] - maxiy)
+                right.calculate_corners_from_one(1)
+                dems.append(right)
+
+        for d in dems:
+            d.set_orientation(self.orientation)
+            #print(d.orientation, "orientation")
+
+            assert d.dots == self.dots
+            
+            #self.current_line = set([v])
+        #self.corners = [v, v, v]
+        # the line is determined by a number [0, 3), 0 1 2 mean left down ne,
+        # and remainder means dist of endpoint on that side, clockwise
+        #self.set_orientation(rat(0, 1))
+        # self.wantedpoint = None
+        #self.timer = 0
+        
+        #print(dems, "reto")
+
+        # the dots that are left over (not in the pieces or the murderer) become unit
+        # triangles. only the dots inside this triangle can be, and for lattice points
+        # has_point is the same as contains
+        demsus = dems[:]
+        for k in self.dots_inside():
+            for q in demsus:
+                if q.has_point(k):
+                    break
+            else:
+                if not murderer.has_point(k):
+                    dems.append(Triangle(k, self.dots))
+
+        return dems
+
+    def set_orientation(self, ori):
+        assert type(ori) == fractions.Fraction or type(ori) == int
+        self.orientation = ori
+        self.pretend_orientation = ori
+        self.calculate_current_line()
+
+    def get_pretend_orientation(self):
+        return self.pretend_orientation % 3
+
+    # find an orientation between a and b such that line differs by exactly one from current_line
+    # we should find a, b such that diff at a is 0 and diff at b is 1: and diff betw a and b is accu
+    def technical_binary_thing(self, a, b, accu = 100):
+        
+        self.techno_counter += 1
+        cl = self.current_line
+        al = self.calculate_line(a)
+        bl = self.calculate_line(b)
+        adiff = al.symmetric_difference(cl)
+        bdiff = bl.symmetric_difference(cl)
+
+        #print("kiliman", a, len(adiff), b, len(bdiff))
+        
+        if len(adiff) == 0 and len(bdiff) == 2 and abs(b - a) < accu:
+            return b
+
+        if len(bdiff) == 0:
+            b = a + (b - a) * 2 # rat(5,2)
+            return self.technical_binary_thing(a, b, accu)
+
+        #print("vs", a, len(adiff), b, len(bdiff))
+        
+        assert len(adiff) == 0
+        mid = (a + b) / 2
+        midl = self.calculate_line(mid)
+        middiff = midl.symmetric_difference(cl)
+        
+        if len(middiff) == 0:
+            return self.technical_binary_thing(mid, b, accu)
+        else:
+            return self.technical_binary_thing(a, mid, accu)
+            
+    # the old way to find the next orientation: naive binary search with technical_binary_thing.
+    # calculate_next_orientation doesn't use this anymore, check_geometry.py checks
+    # its sweep schedule against it
+    def bisect_next_orientation(self, inc):
+        self.techno_counter = 0
+        return self.technical_binary_thing(self.orientation, self.orientation + rat(inc, self.size))
+
+    # next orientation where the line differs by exactly one point: the next step of
+    # our sweep_schedule, and the move it makes (put in place relative to corners[0])
+    def calculate_next_orientation(self):
+        if not self.schedule.has_step(self.schedule_pos):
+            self.finish_rotation()
+            return
+        self.next_orientation, a, b = self.schedule.step(self.schedule_pos)
+        self.next_move = [vadd(self.corners[0], a), vadd(self.corners[0], b)]
+        self.schedule_pos += 1
+
+    # we have the same line as the wanted orientation, so just jump there
+    def finish_rotation(self):
+        self.done = True
+        self.orientation = self.wanted_orientation
+        self.next_orientation = self.wanted_orientation
+        self.current_line = self.wanted_line
+
+    def set_wanted_orientation(self, ori):
+        ori = rat(ori, 1)
+        self.wanted_orientation = ori
+        self.wanted_line = self.calculate_line(ori)
+        #print(self.current_line, "ami")
+        #print(self.final_line)
+        self.timer = 0
+        self.done = False
+        self.schedule = sweep_schedule(self.size, self.orientation % 3, ori % 3)
+        self.schedule_pos = 0
+
+        if self.wanted_line == self.current_line:
+            self.done = True
+            self.set_orientation(self.wanted_orientation)
+        self.calculate_next_orientation()
+
+    # def self.pretend_orientation = self.current_orientation
+            
+    def set_merge_orientation_from_pt(self, side, pt):
+        a, b = side_to_endpoints_cw(side)
+        #print("side to end", side, a, b)
+        av, bv = self.corners[a], self.corners[b]
+        at = unlerp(pt, av, bv)
+        #print(at, "is where it's at", (side + at) % 3)
+        self.set_wanted_orientation((side + at) % 3)
+        #print(self.corners[0], "wante", self.wanted_orientation)
+            
+    # rotate line; there should be a triangle move whenever sum of steps passes an integer
+    # we should rotate line, change our current dots, and
+    # also send back a list of triangle moves (it's always going to be a singleton or empty in this implementation)
+    def update_orientation(self, step):
+        #print("mkiliman")
+        self.timer += step
+        if self.done == True:
+            return []
+
+        moves = []
+        
+        while self.timer >= 1:
+            #print("timor")
+            self.timer -= 1
+            moves.extend(self.rotation_step())
+        self.pretend_orientation = slerp(self.timer, self.orientation, self.next_orientation)
+        
+        return moves
+
+    # go to next_orientation right away, no timer involved; returns the list of moves
+    # (singleton or empty) like update_orientation. the line at next_orientation is the
+    # current one with the dot of the move swapped for where it goes, so we just swap
+    # that in current_line instead of calculating the line again
+    def rotation_step(self):
+        moves = []
+        if self.orientation != self.next_orientation:
+            moves.append(self.next_move)
+            a, b = self.next_move
+            self.current_line.remove(a)
+            self.current_line.add(b)
+
+        self.orientation = self.next_orientation
+        self.pretend_orientation = self.next_orientation
+        self.calculate_next_orientation()
+        return moves
+
+    def calculate_current_line(self):
+        #print("calculating curne", self.orientation, repr(self.orientation))
+        self.current_line = self.calculate_line(self.orientation)
+
+    # size and this particular'th corner should be correct,
+    # then calculate other corners
+    def calculate_corners_from_one(self, corner):
+        s = self.size - 1
+        if corner == 0:
+            self.corners[1] = vadd(self.corners[0], (0, s))
+            self.corners[2] = vadd(self.corners[0], (s, 0))
+        if corner == 1:
+            self.corners[0] = vadd(self.corners[1], (0, -s))
+            self.corners[2] = vadd(self.corners[1], (s, -s))
+        if corner == 2:
+            self.corners[0] = vadd(self.corners[2], (-s, 0))
+            self.corners[1] = vadd(self.corners[2], (-s, s))
+
+    def reorientation_done(self):
+        return self.done
+
+    def normalization_generator(self):
+        self.current_height = None
+        self.top_excess = None
+
+        # move the xth column right
+        for x in range(self.size - 1):
+            #print(f"dealing with x = {x}")
+            self.height_of_current_column = self.size - 1 - x # discounting the bottom line
+            
+            # start up
+            # if x = 0, we are in the leftmost column, so height of column is size
+            # size-1 guys need to be moved, starting from topmost
+            self.dropped_count = 0
+            for y in range(self.size - x):
+                #print(f"dealing with y = {y}, basic drop")
+                #print(x, y, "going")
+                self.move_down_instead = False
+                if y == self.size - x - 1:
+                    self.move_down_instead = True
+                if vadd(self.corners[0], (x + 1, y)) in self.dots:
+                    self.move_down_instead = True
+                if not self.move_down_instead:
+                    # first we move the top bottom right
+                    a = (x, y)
+                    b = (x + 1, y)
+                    yield [(a, b)]
+                else:
+                    for z in reversed(list(range(self.dropped_count, y))):
+                        yield [((x, z+1), (x, z))]
+                        
+                    self.dropped_count += 1
+            #print("basic drop finished")
+
+            self.dropped_count -= 1
+
+            if x == 0:
+                self.current_height = self.dropped_count
+                self.top_excess = 0
+                
+            else:
+                if self.dropped_count < self.current_height:
+
+                    while self.dropped_count < self.current_height:
+
+                        if self.current_height <= self.height_of_current_column:
+
+                            #print(f"in the loop: dc {self.dropped_count}, ch {self.current_height}, te {self.top_excess}")
+                            if self.dropped_count < self.current_height - 1:
+                                
+                                if self.top_excess > 0:
+                                    for z in range(self.top_excess-1, x-2):
+                                        yield [((z+1, self.current_height), (z+1, self.current_height+1)),
+                                               ((z, self.current_height+1), (z+1, self.current_height))]
+                                
+                                    yield [((x-1, self.current_height), (x, self.current_height-1))]
+                                    yield [((x-2, self.current_height+1), (x-1, self.current_height))]
+                                    for y in reversed(list(range(self.dropped_count+1, self.current_height-1))):
+                                        yield [((x, y+1), (x, y))]
+
+                                    self.top_excess -= 1
+
+                                else:
+
+                                    yield [((x-1, self.current_height), (x, self.current_height-1))]
+                                    for y in reversed(list(range(self.dropped_count+1, self.current_height-1))):
+                                        yield [((x, y+1), (x, y))]
+                                    #print("case A")
+                                    self.top_excess = x-1
+                                    self.current_height -= 1
+
+
+                            else: # difference is 1!!!
+
+                                if self.top_excess > 0:
+                                    #print("heresadf")
+                                    for z in range(self.top_excess-1, x-2):
+                                        yield [((z+1, self.current_height), (z+1, self.current_height+1)),
+                                               ((z, self.current_height+1), (z+1, self.current_height))]
+
+                                    yield [((x, self.current_height-1), (x, self.current_height))]
+                                    yield [((x-1, self.current_height), (x, self.current_height-1))]
+                                    yield [((x-2, self.current_height+1), (x-1, self.current_height))]
+
+                                    self.top_excess -= 1
+
+                                else: # top excess = 0
+                                    #print("case B")
+                                    self.top_excess = x
+                                    self.current_height -= 1
+                                    
+                            self.dropped_count += 1
+                                    
+                        elif self.dropped_count < self.height_of_current_column:
+                            # self.dropped_count < self.current_height AND
+                            # self.current_height > self.height_of_current_column <-- really just this
+                            ell = self.size - (self.current_height + 1) # length of excess row
+                            if self.top_excess > 0:
+                                # step 1: move excess horizontally
+                                # use coordinate of destination
+
+                                # final destination = (ell-1, self.current_height+1)
+                                for xx in range(self.top_excess, ell):
+                                    yield [((xx, self.current_height), (xx, self.current_height+1)),
+                                           ((xx-1, self.current_height+1), (xx, self.current_height))]
+                                    
+                                # step 2: move stuff diagonally
+                                # coord of lowest destination (x, self.height_of_current_column)
+                                # coord of topmost is (ell, self.current_height)
+                                num_steps = self.current_height - self.height_of_current_column + 1
+                                for i in range(num_steps):
+                                    yield [((x-1-i, self.height_of_current_column+1+i), (x-i, self.height_of_current_column+i))]
+                                self.top_excess -= 1
+
+                            else:
+                                num_steps = self.current_height - self.height_of_current_column
+                                for i in range(num_steps):
+                                    yield [((x-1-i, self.height_of_current_column+1+i), (x-i, self.height_of_current_column+i))]
+
+                                self.current_height -= 1
+                                self.top_excess = ell
+
+                            # step 3: drop stuff
+                            # we have dot at (x, hocc), need to move to (x, self.dropped_count+1)
+                            for y in reversed(list(range(self.dropped_count+1, self.height_of_current_column))):
+                                yield [((x, y+1), (x, y))]
+                            
+                            self.dropped_count += 1
+
+                        else:
+                            break
+                                
+                                
+                            
+                    
+                else: # self.dropped_count >= self.current_height:
+                    
+                    while self.dropped_count > self.current_height:
+                        yield [((x, self.current_height), (x-1, self.current_height+1))]
+                        for y in range(self.current_height, self.dropped_count):
+                            yield [((x, y+1), (x, y))]
+                        self.dropped_count -= 1
+
+                        for xx in reversed(list(range(self.top_excess, x-1))):
+                            yield [((xx+1, self.current_height), (xx, self.current_height+1)),
+                                   ((xx+1, self.current_height+1), (xx+1, self.current_height))]
+
+                        self.top_excess += 1
+                        #print(f"moment {self.top_excess}")
+                        if self.top_excess == x and self.dropped_count > self.current_height:
+                            self.top_excess = 0
+                            self.current_height += 1
+                        
+
+        self.normalized = True
+        self.set_orientation(0)
+        while True:
+            yield []
+
+    def start_normalization(self):
+        self.normalization_phase = ORIENT
+        self.set_wanted_orientation(2)
+        self.normalized = False
+
+    def update_normalization(self, step):
+        if self.normalization_phase == ORIENT:
+            upd = self.update_orientation(step)
+            if self.reorientation_done():
+                self.normalization_phase = FALL
+                self.normafun = self.normalization_generator()
+            return upd
+        else:
+            #self.normalized = True
+            self.timer += step
+            upds = []
+            while self.timer >= 1:
+                self.timer -= 1
+                ext = next(self.normafun)
+                for k in ext:
+                    upds.append(tuple(map(lambda a:vadd(self.corners[0], a), k)))
+                #print(f"current height {self.current_height}; top_excess {self.top_excess}; dropped_count {self.dropped_count}")
+                
+            #print(upds)
+            return upds
+
+    def normalization_done(self):
+        return self.normalized
+
+    # the next count or so moves of FALL at once, not translated (like normafun gives
+    # them), for applying them in bulk. they don't have to be applied before the next
+    # ones are asked for: FALL only looks at the cell right of the column it's dropping,
+    # and no move before that has touched it
+    def normalization_chunk(self, count):
+        moves = []
+        while len(moves) < count and not self.normalized:
+            moves.extend(next(self.normafun))
+        return moves
+
+    # the rest of the rotation to wanted_orientation without the timer, the moves like
+    # rotation_step gives them
+    def reorientation_moves(self):
+        while not self.reorientation_done():
+            yield from self.rotation_step()
+
+    # the whole ORIENT then FALL pipeline without the timer, for running with no display.
+    # yields the moves in board coordinates; whoever drives this has to apply each move
+    # to self.dots before asking for the next one, because FALL looks at the dots
+    def normalization_moves(self):
+        self.start_normalization()
+        while not self.reorientation_done():
+            for m in self.rotation_step():
+                yield m
+        self.normalization_phase = FALL
+        self.normafun = self.normalization_generator()
+        for ext in self.normafun:
+            if self.normalization_done():
+                break
+            for k in ext:
+                yield tuple(map(lambda a:vadd(self.corners[0], a), k))
+
+    
+
+def merge_triangles(tri1, tri2):
+    assert tri1.done and tri2.done
+    flip, side = tri1.neighbor_side(tri2)
+    if flip:
+        return merge_triangles(tri2, tri1)
+    # get lines for assertion purposes
+    lines1 = tri1.current_line
+    lines2 = tri2.current_line
+
+    #print("MERGE FINISH")
+    #print(tri1.corners, tri1.orientation)
+    #print(tri2.corners, tri2.orientation)
+    
+    # now tri1 should be made larger by size of tri2, in direction side
+    t = Triangle((0, 0), tri1.dots) # (0, 0) is cuz don't matter
+    t.size = tri1.size + tri2.size
+    t.set_orientation(tri1.orientation)
+    if tri1.size > 1 and tri2.size > 1:
+        assert tri1.orientation == tri2.orientation
+    opposite_point = 2 - side
+    t.corners = [None, None, None]
+    t.corners[opposite_point] = tri1.corners[opposite_point]
+    t.calculate_corners_from_one(2 - side)
+    t.calculate_current_line()
+
+    #print(t.corners, t.orientation, "result")
+    #print(t.current_line)
+    #print(t.calculate_line(t.orientation))
+
+    return t
+
+# the set of triangles, with a spatial index: a uniform grid of buckets, and each
+# triangle is in the buckets its bounding box (with a margin of 1) touches. we also
+# keep the adjacency graph (is_neighbor) up to date, neighbors touch so they share a
+# bucket. the corners of a triangle must not change while it's in here (they don't,
+# merges and kills make new triangles)
+class TriangleSet:
+    BUCKET = 8
+
+    def __init__(self, triangles = ()):
+        self.triangles = set()
+        self.buckets = {}
+        self.adjacent = {}
+        # like Board.changes, triangles that are added or removed go here if it's a list
+        self.changes = None
+        self.update(triangles)
+
+    def bucket_keys(self, t):
+        x0, y0 = t.corners[0]
+        b = self.BUCKET
+        for bx in range(math.floor((x0 - 1)/b), math.floor((x0 + t.size)/b) + 1):
+            for by in range(math.floor((y0 - 1)/b), math.floor((y0 + t.size)/b) + 1):
+                yield bx, by
+
+    def __contains__(self, t):
+        return t in self.triangles
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def __iter__(self):
+        return iter(self.triangles)
+
+    def add(self, t):
+        if t in self.triangles:
+            return
+        nbrs = set()
+        for other in self.near(t):
+            if t.is_neighbor(other):
+                nbrs.add(other)
+                self.adjacent[other].add(t)
+        self.adjacent[t] = nbrs
+        self.triangles.add(t)
+        for k in self.bucket_keys(t):
+            self.buckets.setdefault(k, set()).add(t)
+        if self.changes != None:
+            self.changes.append(t)
+
+    def remove(self, t):
+        self.triangles.remove(t)
+        for k in self.bucket_keys(t):
+            bucket = self.buckets[k]
+            bucket.discard(t)
+            if len(bucket) == 0:
+                del self.buckets[k]
+        for other in self.adjacent.pop(t):
+            self.adjacent[other].discard(t)
+        if self.changes != None:
+            self.changes.append(t)
+
+    def discard(self, t):
+        if t in self.triangles:
+            self.remove(t)
+
+    def update(self, triangles):
+        for t in triangles:
+            self.add(t)
+
+    # a triangle that contains the (logical) position pos, or None
+    def at(self, pos, margin = MARGIN):
+        b = self.BUCKET
+        for t in self.buckets.get((math.floor(pos[0]/b), math.floor(pos[1]/b)), ()):
+            if t.contains(pos, margin):
+                return t
+        return None
+
+    # the triangles (other than tri) that share a bucket with tri
+    def near(self, tri):
+        near = set()
+        for k in self.bucket_keys(tri):
+            near.update(self.buckets.get(k, ()))
+        near.discard(tri)
+        return near
+
+    # the triangles whose bounding box (with the margin of a cell around it, like
+    # bucket_keys) meets x0 <= x <= x1, y0 <= y <= y1
+    def in_rect(self, x0, y0, x1, y1):
+        b = self.BUCKET
+        bx0, by0 = math.floor(x0/b), math.floor(y0/b)
+        bx1, by1 = math.floor(x1/b), math.floor(y1/b)
+        # a rect much bigger than the board (zoomed out), look at the buckets there are
+        if (bx1 - bx0 + 1)*(by1 - by0 + 1) > len(self.buckets):
+            keys = [k for k in self.buckets if bx0 <= k[0] <= bx1 and by0 <= k[1] <= by1]
+        else:
+            keys = [(bx, by) for bx in range(bx0, bx1 + 1) for by in range(by0, by1 + 1)]
+        found = set()
+        for k in keys:
+            for t in self.buckets.get(k, ()):
+                tx, ty = t.corners[0]
+                if tx - 1 <= x1 and tx + t.size >= x0 and ty - 1 <= y1 and ty + t.size >= y0:
+                    found.add(t)
+        return found
+
+    # the other triangles that intersect tri
+    def overlapping(self, tri):
+        return [t for t in self.near(tri) if t.intersects(tri)]
+
+    # the triangles t is_neighbor with
+    def neighbors(self, t):
+        return self.adjacent.get(t, set())
+
+# scalar lerp
+def slerp(t, a, b):
+    return a + t*(b - a)
+
+# given p, a, b, calculate (some) t such that p = a + t(b - a)
+def unlerp(p, a, b):
+    if a[0] == b[0] and a[1] == b[1]:
+        assert p == a
+        return 0
+    if a[0] == b[0]:
+        return unlerp((p[1], p[0]), (a[1], a[0]), (b[1], b[0])) # we can do any affine transformation to the triple clearly
+    """
+    p = a + t(b - a)
+    px = ax + t(bx - ax)
+    (px - ax)/(bx - ax) = t
+    """
+    return (p[0] - a[0])/(rat(b[0], 1) - rat(a[0], 1))
+
+# the orientations where the line of a size n triangle changes, in order, starting from
+# ori and going in direction inc (1 or -1), forever (it wraps around to the next side).
+#
+# closed form: on side s with t = ori - s, the k'th point of the line is
+# start + k*moves[0] + j_k*(moves[1] - moves[0]) where j_k rounds (half down)
+# k*t - (n-1-k)/(20n), the last bit is the epsilon of calculate_line. so j_k goes from m
+# to m+1 just after t = (m + 1/2 + (n-1-k)/(20n))/k, and these are all different, so
+# each one changes exactly one point. for each k they are 1/k apart, so we just merge
+# the n-1 sequences with a heap, which is O(log n) per change.
+#
+# yields (orientation, side, k, m): at that orientation point k of the line on that side
+# has j_k = m, and just above it has m+1. the line is constant on (c, c'] between
+# consecutive ones
+def critical_orientations(n, ori, inc):
+    base = math.floor(ori)
+    t = rat(ori) - base
+    while True:
+        p, q = t.numerator, t.denominator
+        heap = []
+        for k in range(1, n):
+            # smallest m with (20nm + 11n - 1 - k)/(20nk) >= t
+            m = -((q*(11*n - 1 - k) - 20*n*k*p) // (20*n*q))
+            if inc == 1:
+                m = max(m, 0)
+                if m < k:
+                    heap.append((rat(20*n*m + 11*n - 1 - k, 20*n*k), k, m))
+            else:
+                m = min(m, k) - 1
+                if m >= 0:
+                    heap.append((-rat(20*n*m + 11*n - 1 - k, 20*n*k), k, m))
+        heapq.heapify(heap)
+        while heap:
+            c, k, m = heap[0]
+            if inc == 1:
+                yield base + c, base % 3, k, m
+                if m + 1 < k:
+                    heapq.heapreplace(heap, (c + rat(1, k), k, m + 1))
+                else:
+                    heapq.heappop(heap)
+            else:
+                yield base - c, base % 3, k, m
+                if m > 0:
+                    heapq.heapreplace(heap, (c + rat(1, k), k, m - 1))
+                else:
+                    heapq.heappop(heap)
+        if inc == 1:
+            base += 1
+            t = rat(0)
+        else:
+            base -= 1
+            t = rat(1)
+
+# how calculate_line walks the line on a side: from which corner, and with which two moves
+def side_walk(side):
+    if side == 0:
+        return 2, [(-1, 0), (-1, 1)]
+    if side == 1:
+        return 1, [(1, -1), (0, -1)]
+    if side == 2:
+        return 0, [(0, 1), (1, 0)]
+
+# the orientation of a crossing of critical_orientations, from its side base, k and m
+def crossing_orientation(n, base, k, m):
+    return base + rat(20*n*m + 11*n - 1 - k, 20*n*k)
+
+# a whole rotation of a size n line from orientation start toward wanted, as the
+# crossings of critical_orientations we pass, packed in an array as base, k, m.
+# going up the orientation of step i is the crossing after it (see
+# calculate_next_orientation), so then there is one extra crossing at the end.
+# a big rotation has a lot of crossings, so they are only read from
+# critical_orientations as the steps are asked for, and not all at once
+class SweepSchedule:
+    def __init__(self, n, start, wanted):
+        self.n = n
+        self.inc = 1
+        self.crossings = array.array('q')
+        self.steps = 0
+        self.pending = None # the rest of critical_orientations, None when we have them all
+        self.cache = None # the ScheduleCache counting our crossings
+        if n == 1:
+            return
+
+        final = wanted
+        # naively pick rotation direction based on distance
+        # I do not know if it's correct, but presumably close enough
+        for k in [wanted - 3, wanted + 3]:
+            if abs(k - start) < abs(final - start):
+                final = k
+        if final < start:
+            self.inc = -1
+        self.final = final
+        self.pending = critical_orientations(n, start, self.inc)
+
+    # read crossings until there are more than i steps, or the rotation ends. going up
+    # step i needs the crossing after it too
+    def read(self, i):
+        before = len(self.crossings)
+        wanted = 3*(i + 2 if self.inc == 1 else i + 1)
+        while self.pending != None and len(self.crossings) < wanted:
+            c, side, k, m = next(self.pending)
+            if self.inc == 1:
+                if self.final <= c:
+                    if self.steps > 0:
+                        self.crossings.extend((math.floor(c), k, m))
+                    self.pending = None
+                    break
+            elif self.final > c:
+                self.pending = None
+                break
+            self.crossings.extend((math.floor(c), k, m))
+            self.steps += 1
+        if self.cache != None and len(self.crossings) > before:
+            self.cache.grew((len(self.crossings) - before)//3)
+
+    def has_step(self, i):
+        if self.pending != None:
+            self.read(i)
+        return i < self.steps
+
+    # the number of steps, which reads the whole rotation
+    def __len__(self):
+        while self.pending != None:
+            self.read(self.steps)
+        return self.steps
+
+    # orientation after step i, and the move a -> b it makes, relative to the btm-left corner
+    def step(self, i):
+        if self.pending != None:
+            self.read(i)
+        n = self.n
+        cr = self.crossings
+        base, k, m = cr[3*i], cr[3*i + 1], cr[3*i + 2]
+        corner, moves = side_walk(base % 3)
+        m0, m1 = moves
+        pt = vadd([(0, 0), (0, n - 1), (n - 1, 0)][corner], smul(k, m0))
+        a = vadd(pt, smul(m, vsub(m1, m0)))
+        b = vadd(pt, smul(m + 1, vsub(m1, m0)))
+        if self.inc == 1:
+            j = 3*(i + 1)
+            return crossing_orientation(n, cr[j], cr[j + 1], cr[j + 2]), a, b
+        else:
+            return crossing_orientation(n, base, k, m), b, a
+
+# every merge and kill rotates lines between the same few orientations, and the moves
+# relative to the corner only depend on the size and the two orientations, so we keep
+# the recent schedules around. a schedule of size n has about n^2/2 crossings, so the
+# least recently used ones go when there are more than max_crossings read in all of them
+class ScheduleCache:
+    def __init__(self, max_crossings):
+        self.max_crossings = max_crossings
+        self.schedules = {} # in the order they were used, the oldest first
+        self.crossings = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, n, start, wanted):
+        key = n, start, wanted
+        schedule = self.schedules.pop(key, None)
+        if schedule != None:
+            self.hits += 1
+            self.schedules[key] = schedule
+            return schedule
+        self.misses += 1
+        schedule = SweepSchedule(n, start, wanted)
+        schedule.cache = self
+        self.schedules[key] = schedule
+        return schedule
+
+    # a schedule read more crossings. the oldest schedules go if that's too many, even
+    # the one that grew: it can keep going, we just don't keep it anymore
+    def grew(self, crossings):
+        self.crossings += crossings
+        while self.crossings > self.max_crossings and len(self.schedules) > 1:
+            old = self.schedules.pop(next(iter(self.schedules)))
+            old.cache = None
+            self.crossings -= len(old.crossings)//3
+            self.evictions += 1
+
+    def clear(self):
+        for schedule in self.schedules.values():
+            schedule.cache = None
+        self.schedules.clear()
+        self.crossings = 0
+
+    def set_max_crossings(self, max_crossings):
+        self.max_crossings = max_crossings
+        self.clear()
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "schedules": len(self.schedules), "crossings": self.crossings}
+
+# 2 million crossings of three int64, 48 MB
+SCHEDULE_CACHE_CROSSINGS = 1 << 21
+schedule_cache = ScheduleCache(SCHEDULE_CACHE_CROSSINGS)
+
+def sweep_schedule(n, start, wanted):
+    return schedule_cache.get(n, start, wanted)
+
+# lines that were calculated before, for calculate_line. every merge and kill turns
+# triangles of the same few sizes to the same few orientations, and a line doesn't
+# depend on where the triangle is, and the lines of the three sides are the same
+# shapes turned by a third (that maps the lattice and the triangle to themselves and
+# keeps the cross products of rasterize_line, so the walk is exactly the same). so
+# we keep the line of side 2 of a triangle at (0, 0) by the size and the fraction of
+# the orientation, as arrays of the x and y coordinates. the least recently used ones
+# go when there are more than max_points points in all of them
+class LineCache:
+    def __init__(self, max_points):
+        self.max_points = max_points
+        self.shapes = {} # in the order they were used, the oldest first
+        self.points = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # the line of size n at orientation 2 + t, as (xs, ys) sorted by x + y
+    def get(self, n, t):
+        key = n, t
+        shape = self.shapes.pop(key, None)
+        if shape != None:
+            self.hits += 1
+            self.shapes[key] = shape
+            return shape
+        self.misses += 1
+        if n == 1:
+            # a new Triangle is size 1 and calculates its line, so not with a Triangle
+            line = [(0, 0)]
+        else:
+            tri = Triangle((0, 0), None)
+            tri.size = n
+            tri.calculate_corners_from_one(0)
+            line = tri.rasterize_line(2 + t)
+        shape = array.array("l", [x for x, y in line]), array.array("l", [y for x, y in line])
+        self.shapes[key] = shape
+        self.points += n
+        while self.points > self.max_points and len(self.shapes) > 1:
+            old = next(iter(self.shapes))
+            self.points -= len(self.shapes.pop(old)[0])
+            self.evictions += 1
+        return shape
+
+    def clear(self):
+        self.shapes.clear()
+        self.points = 0
+
+    def set_max_points(self, max_points):
+        self.max_points = max_points
+        self.clear()
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "shapes": len(self.shapes), "points": self.points}
+
+# 2 million points, 32 MB
+LINE_CACHE_POINTS = 1 << 21
+line_cache = LineCache(LINE_CACHE_POINTS)
+
+def side_to_endpoints_cw(side):
+    side = side % 3
+    if side == 0:
+        return 0, 1
+    if side == 1:
+        return 2, 0
+    if side == 2:
+        return 1, 2
+
+def apply_random(dots):
+    d = dots.random_dot()
+    #print(d)
+    tri = [(0,0), (1,0), (0,1)]
+    idx = random.randint(0, 2)
+    tri = set(map(lambda a:vadd(d, vsub(a, tri[idx])), tri))
+    tri.remove(d)
+    #print(tri)
+    tri = list(tri)
+    random.shuffle(tri)
+    assert len(tri) == 2 and d not in tri
+    if tri[0] in dots and tri[1] not in dots:
+        #print("did")
+        dots.remove(tri[0])
+        dots.add(tri[1])
+    else:
+        #print("sad")
+        pass
+
+# apply a move (a, b) like the main loop does: the dot at a jumps to b,
+# unless there is a dot at b already (then the line just takes that gray dot)
+def apply_move(dots, m):
+    a, b = m[0], m[1]
+    assert pivot_exists(dots, a, b)
+    assert a in dots
+    if b not in dots:
+        dots.remove(a)
+        dots.add(b)
+
+# triangle of the given size with btm-left corner at corner, line at orientation ori
+def make_triangle(corner, size, dots, ori = 0):
+    t = Triangle(corner, dots)
+    t.size = size
+    t.calculate_corners_from_one(0)
+    t.set_orientation(ori)
+    return t
+
+# headless normalization, as fast as the cpu goes: no display and no per-frame timer.
+# the moves are applied to tri.dots as we go, and each one is yielded after it's applied
+def normalization_stream(tri):
+    for m in stats.moves(tri.normalization_moves(), "normalize"):
+        apply_move(tri.dots, m)
+        yield m
+
+# same but all at once, returns the list of moves
+def normalize(tri):
+    return list(normalization_stream(tri))
+
+# batch_moves needs numpy, which takes longer to import than everything else here, so
+# it's only imported when it's first needed. None if there's no numpy
+@functools.lru_cache(maxsize = None)
+def load_batch_moves():
+    try:
+        import batch_moves
+    except ImportError:
+        return None
+    return batch_moves
+
+# apply a batch of moves (see batch_moves) to dots in bulk and log them. if they can't
+# go in bulk they go one by one with apply_move
+def apply_moves(dots, moves, log = None):
+    batch_moves = load_batch_moves()
+    if not batch_moves.apply_moves(dots, moves):
+        for a, b in moves.tolist():
+            apply_move(dots, (tuple(a), tuple(b)))
+    if log != None:
+        batch_moves.log_moves(log, moves)
+
+# normalize tri like normalize, but FALL goes in chunks of moves applied in bulk, which
+# is a lot faster for big triangles (without numpy it's normalization_stream after all).
+# returns just the number of moves
+def normalize_batched(tri, log = None, chunk = NORMALIZE_CHUNK):
+    batch_moves = load_batch_moves()
+    if batch_moves == None:
+        count = 0
+        for m in normalization_stream(tri):
+            if log != None:
+                log.move(m)
+            count += 1
+        return count
+    tri.start_normalization()
+    count = 0
+    for m in stats.moves(tri.reorientation_moves(), "normalize"):
+        apply_move(tri.dots, m)
+        if log != None:
+            log.move(m)
+        count += 1
+    tri.normalization_phase = FALL
+    tri.normafun = tri.normalization_generator()
+    start = time.perf_counter()
+    fall = 0
+    while not tri.normalization_done():
+        moves = batch_moves.translate(tri.normalization_chunk(chunk), tri.corners[0])
+        apply_moves(tri.dots, moves, log)
+        fall += len(moves)
+    if stats.enabled:
+        stats.add("moves/normalize", fall)
+        stats.add("seconds/normalize", time.perf_counter() - start)
+    return count + fall
+
+# normalize a board given in the from_s format. the triangle is the smallest one
+# containing all the dots, and its line is the first of orientations 0, 1, 2 that
+# is all black (unless ori says which). returns the moves and the final dots
+def normalize_s(s, ori = None):
+    return normalize_dots(from_s(s), ori)
+
+# same for a bunch of coordinates
+def normalize_dots(dots, ori = None):
+    tri, dots = normalization_triangle(dots, ori)
+    if tri == None:
+        return [], dots
+    moves = normalize(tri)
+    return moves, dots
+
+# same with normalize_batched, returns the number of moves and the final dots
+def normalize_dots_batched(dots, ori = None):
+    tri, dots = normalization_triangle(dots, ori)
+    if tri == None:
+        return 0, dots
+    return normalize_batched(tri), dots
+
+# the Board of the dots, and the triangle to normalize them in (None if there are no dots)
+def normalization_triangle(dots, ori = None):
+    dots = Board(dots)
+    if len(dots) == 0:
+        return None, dots
+    left = min(d[0] for d in dots)
+    bottom = min(d[1] for d in dots)
+    size = max(d[0] - left + d[1] - bottom for d in dots) + 1
+    tri = make_triangle((left, bottom), size, dots)
+    if ori == None:
+        for o in range(3):
+            if all(p in dots for p in tri.calculate_line(o)):
+                ori = o
+                break
+        else:
+            raise ValueError("no black line on the sides of the bounding triangle")
+    tri.set_orientation(ori)
+    if not all(p in dots for p in tri.current_line):
+        raise ValueError("line at orientation %s is not all black" % ori)
+    return tri, dots
+
+# the moves that merge the neighbours tri1 and tri2 (both in triangles) like MERGING and
+# KILL do in main(), and cut the triangles the result runs over. apply each move before
+# asking for the next one. triangles is kept up to date, and the generator returns
+# the triangles it added (the merged one and the pieces of the cut ones). if there's a
+# log (a movelog.MoveLog) the merge and the cuts are marked in it
+def merge_moves(triangles, tri1, tri2, log = None):
+    if log != None:
+        log.mark(movelog.MERGE, merge_footprint(tri1, tri2))
+    set_merge_orientations(tri1, tri2)
+    for t in [tri1, tri2]:
+        yield from stats.moves(t.reorientation_moves(), "merge")
+    tri = merge_triangles(tri1, tri2)
+    triangles.remove(tri1)
+    triangles.remove(tri2)
+    triangles.add(tri)
+    new = [tri]
+
+    killeds = triangles.overlapping(tri)
+    for t in killeds:
+        t.die(tri)
+        if log != None:
+            log.mark(movelog.KILL, t)
+    for t in killeds:
+        yield from stats.moves(t.reorientation_moves(), "kill")
+        pieces = t.merge_with_murderer(tri)
+        triangles.update(pieces)
+        triangles.remove(t)
+        new.extend(pieces)
+    return new
+
+# a triangle where merge_triangles(tri1, tri2) will put the merged one (just the corners
+# and size, its line is nothing), to see what it would run over before doing it
+def merge_footprint(tri1, tri2):
+    flip, side = tri1.neighbor_side(tri2)
+    if flip:
+        tri1, tri2 = tri2, tri1
+    t = Triangle((0, 0), tri1.dots)
+    t.size = tri1.size + tri2.size
+    t.corners = [None, None, None]
+    t.corners[2 - side] = tri1.corners[2 - side]
+    t.calculate_corners_from_one(2 - side)
+    return t
+
+# picks the merges for auto-play. of the neighbouring pairs, the one with the smallest
+# total size goes first, so triangles grow level by level (like a quadtree does) instead
+# of one big triangle turning its whole line for every unit triangle it eats, which
+# would be n^4 moves and not n^3. a merge also cuts whatever it runs over, and cutting
+# a triangle as big as the merged one can undo an earlier merge and go around in circles
+# forever, so we only take merges that make a triangle bigger than all the ones they cut.
+# then the sizes sorted biggest first go up (lexicographically) with every merge, so
+# this ends. the pairs are on a heap, stale ones (one of them is gone) are skipped,
+# and a pair that's blocked by a too big triangle waits until that triangle is gone
+class AutoPlay:
+    def __init__(self, triangles, log = None):
+        self.triangles = triangles
+        self.log = log
+        self.heap = []
+        self.counter = 0
+        self.blocked = {}
+        self.add(triangles)
+
+    def push(self, t, o):
+        # the corners break ties, so a board always plays the same way
+        heapq.heappush(self.heap, (t.size + o.size, t.corners[0], o.corners[0], self.counter, t, o))
+        self.counter += 1
+
+    # new triangles (from merges and cuts) have new neighbours, and triangles that are
+    # gone don't block anything anymore
+    def add(self, new):
+        for t in new:
+            for o in self.triangles.neighbors(t):
+                self.push(t, o)
+        for blocker in [b for b in self.blocked if b not in self.triangles]:
+            for t, o in self.blocked.pop(blocker):
+                self.push(t, o)
+
+    # the next pair to merge, or None if there's nothing (useful) to merge
+    def next_merge(self):
+        while len(self.heap) > 0:
+            t, o = heapq.heappop(self.heap)[-2:]
+            if t not in self.triangles or o not in self.triangles:
+                continue
+            tri = merge_footprint(t, o)
+            cut = [k for k in self.triangles.overlapping(tri) if k is not t and k is not o]
+            biggest = max(cut, key = lambda k: k.size, default = None)
+            if biggest != None and biggest.size >= tri.size:
+                self.blocked.setdefault(biggest, []).append((t, o))
+                continue
+            return t, o
+        return None
+
+    # the triangles left when there's nothing to merge, to be normalized, biggest first
+    def to_normalize(self):
+        return sorted(self.triangles, key = lambda t: (-t.size, t.corners[0]))
+
+    # the whole game: merge until there are no neighbours left, then normalize
+    # whatever is left. apply each move before asking for the next one
+    def moves(self):
+        while True:
+            pair = self.next_merge()
+            if pair == None:
+                break
+            self.add((yield from merge_moves(self.triangles, *pair, self.log)))
+        for t in self.to_normalize():
+            if self.log != None:
+                self.log.mark(movelog.NORMALIZE, t)
+            yield from stats.moves(t.normalization_moves(), "normalize")
+
+# auto-play the dots (a Board) with no display, as fast as the cpu goes. returns the
+# number of moves, the wall time in seconds and the triangles at the end. everything
+# goes in the log if there is one (a movelog.MoveLog)
+def autoplay(dots, log = None):
+    start = time.perf_counter()
+    triangles = TriangleSet(Triangle(v, dots) for v in dots)
+    if log != None:
+        log.start(dots)
+    count = 0
+    for m in AutoPlay(triangles, log).moves():
+        apply_move(dots, m)
+        if log != None:
+            log.move(m)
+        count += 1
+    return count, time.perf_counter() - start, triangles
+
+# inverse of from_s (up to translation: the btm-left of the bounding box goes to (0, 0))
+def to_s(dots):
+    if len(dots) == 0:
+        return ""
+    left = min(d[0] for d in dots)
+    bottom = min(d[1] for d in dots)
+    right = max(d[0] for d in dots)
+    top = max(d[1] for d in dots)
+    rows = []
+    for y in reversed(range(bottom, top + 1)):
+        rows.append("".join("1" if (x, y) in dots else "0" for x in range(left, right + 1)))
+    return "\n".join(rows)
+
+
+# check that we can move from a to b
+def pivot_exists(dots, a, b):
+    if b == vadd(a, (0, 1)):
+        return vadd(a, (1, 0)) in dots
+    if b == vadd(a, (1, 0)):
+        return vadd(a, (0, 1)) in dots
+    if b == vadd(a, (0, -1)):
+        return vadd(a, (1, -1)) in dots
+    if b == vadd(a, (1, -1)):
+        return vadd(a, (0, -1)) in dots
+    if b == vadd(a, (-1, 0)):
+        return vadd(a, (-1, 1)) in dots
+    if b == vadd(a, (-1, 1)):
+        return vadd(a, (-1, 0)) in dots
@@ -3,51 +3,20 @@
 import pygame
 from pygame.locals import *
 import random
-import fractions
-rat = fractions.Fraction
 import math
-
-"""
-Mostly internal details are discussed in these comments. See readme.txt for instructions for the user.
-
-I use the L-orientation in implementation, but when drawing we will move the top point
-instructions.txt so we have an equilateral grid.
-
-Objects:
-* dots: a set of elements of \Z^2
-* triangles: triangles (equilateral in \Delta-orientation) where we have built a 
-line. The triangle knows the orientation of the line, it's determined by a single
-rational point on the boundary. It also knows which dots are associated with the
-line, and they are _black_. A triangle can be endangered_, that's a bool. Also _invasive_.
-* dots not part of line of any triangle are _gray_
-
-Whenever a new triangle is formed (because two triangles join), we may get that
-some triangle intersects the new one. If such a triangle is entirely inside a newly
-formed triangle, it just turns gray immediately.
-
-Other such triangles are all marked as endangered and the new triangle is marked
-invasive. We cannot merge any triangles that are endangered or invasive, or 
-such that after the merge they would touch an endangered or invasive one.
-
-We can get rid of an endangered triangle T as follows, where U is invasive.
-If T has a corner inside U, then rotate its line so that that line starts
-from that corner, then turn everything in U gray and you are left with a smaller
-triangle in place of T. If U has a corner inside T, then put all dots of T
-on the side that goes through U, cutting T into two triangles.
-
-Finally, an invasive triangle becomes non-invasive once we remove the endangereds.
-
-In the implementation, we will use a PyGame loop and at all times we draw the situation.
-We have a current operation that's happening, which can be to merge or undanger an
-endangered. In each case, we want to rotate the line of some triangle to some
-other point. We will calculate the next orientation that changes something, and
-then we lerp toward that one...
-
-ORDERS: for vertices, btm-left = 0, top = 1, right = 2
-for lines, left, bottom, ne [sic]
-"""
-
-
+import time
+import sys
+import movelog
+import cProfile
+import collections
+try:
+    import random_walk # needs numpy
+except ImportError:
+    random_walk = None
+
+# the game itself (dots, triangles, merging, normalizing) is in triangle_core, this is
+# the pygame front end that shows it and lets you play
+from triangle_core import *
 
 # these are for the state machine that tells us what we're doing
 IDLE = 1
@@ -62,8 +31,30 @@ SOLITAIRE = 6
 
 idles = [IDLE, EDITING, SOLITAIRE]
 
-ORIENT = 7
-FALL = 8
+# the frame timing overlay averages over this many frames
+TIMING_FRAMES = 60
+# the profiler key profiles this many frames
+PROFILE_FRAMES = 120
+# seconds of a frame that turbo spends on the operations
+TURBO_BUDGET = 0.05
+# the frames per second the window is limited to (--fps, 0 for no limit)
+FPS = 60
+# the simulation goes by the clock and not by frames: speed is moves per 1/SPEED_FPS
+# seconds, and so are the random steps. a frame longer than MAX_FRAME_TIME seconds
+# (after waiting for events, or a slow one) counts as only that long
+SPEED_FPS = 60
+MAX_FRAME_TIME = 0.1
+# when nothing is going on we wait for events instead of drawing frames, but still
+# draw one every this many milliseconds
+IDLE_WAIT_MS = 500
+# keys that do something for as long as they're held down
+HELD_KEYS = [K_UP, K_DOWN, K_LEFT, K_RIGHT, K_a, K_z, K_s, K_x]
+
+# what the moves and the time in these states count as in stats
+STAT_KINDS = {MERGING : "merge", KILL : "kill", NORMALIZE : "normalize"}
+
+# playing a move log
+REPLAY = 9
 
 murderer = None
 
@@ -72,871 +63,20 @@ xpos, ypos = 0, 0 # logical position at center of screen
 width, height = 1000, 700
 
 chosentriangle = None
-MARGIN = 0.3
 
 speed = rat(1,20)
 
-
-
-
-
-
-def from_s(s):
-    dots = set()
-    s = s.strip()
-    lines = s.split("\n")
-    y = len(lines)-1
-    for l in lines:
-        x = 0
-        for c in l:
-            if c == "1":
-                dots.add((x, y))
-            x += 1
-        y -= 1
-    return dots
-        
-    
-
-def vadd(a, b):
-    return a[0]+b[0], a[1]+b[1]
-
-def vsub(a, b):
-    return a[0]-b[0], a[1]-b[1]
-
-def dot(a, b):
-    return a[0]*b[0] + a[1]*b[1]
-
-def smul(s, v):
-    return s*v[0], s*v[1]
-
-def rotate_right(v):
-    return (v[1], -v[0])
-
-def rotate_left(v):
-    return (-v[1], v[0])
-
-def sqrdist(u, v):
-    return (v[0]-u[0])**2 + (v[1]-u[1])**2
-
-def right_of_line(line, pos):
-    a = line[0]
-    b = line[1]
-    bma = vsub(b, a)
-    rel = vsub(pos, a)
-    return dot(rotate_right(bma), rel) >= 0
-
-def triangle_contains(triangle_as_lines, pos):
-    for line in triangle_as_lines:
-        if not right_of_line(line, pos):
-            #print("not tirhg", line, pos)
-            return False
-    return True
-
-def line_intersection(line1, line2):
-    #print(line1, line2, "impi")
-    a, b = line1
-    b = vsub(b, a)
-    if b == (0, 0):
-        raise Exception("o no")
-    c, d = line2
-    d = vsub(d, c)
-    """
-    line1 = a + tb
-    line2 = c + ud
-    
-    ax + t bx = cx + u dx
-    ay + t by = cy + u dy
-
-    ax (by/bx) + t by = (by/bx)(cx + u dx)
-    ay + t by = cy + u dy
-
-    ax (by/bx) - ay = (by/bx) cx + (by/bx) u dx - cy - u dy
-
-    ax (by/bx) - ay = (by/bx) cx - cy + u ((by/bx) dx - dy)
-
-    (ax (by/bx) - ay + cy - (by/bx) cx) / ((by/bx) dx - dy) = u
-
-    t = (cy + u dy - ay) / by
-    """
-    if b[0] != 0:
-        #b0 = b0
-        u = (a[0] * (b[1]/b[0]) - a[1] + c[1] - (b[1]/b[0]) * c[0]) / ((b[1]/b[0]) * d[0] - d[1])
-        # t = (c[1] + u * d[1] - a[1]) / b[1]
-        # assert vadd(c, smul(u, d)) == vadd(a, smul(t, b))
-        return vadd(c, smul(u, d))
-    else:
-        line1 = rotate_right(line1[0]), rotate_right(line1[1])
-        line2 = rotate_right(line2[0]), rotate_right(line2[1])
-        inte = line_intersection(line1, line2)
-        #print("had to rot", inte)
-        return rotate_left(inte)
-
-def set_merge_orientations(tri1, tri2):
-    flip, side = tri1.neighbor_side(tri2)
-    if flip:
-        tri1, tri2 = tri2, tri1
-
-    # flipped so that tri2's corner is on a side of tri1
-
-    l = (tri1.corners[2 - side], tri2.corners[2 - side])
-    
-    if tri1.size > 1 and tri2.size > 1:
-    
-        # now, a corner of tri2 is on a side of tri1,
-        # and that side dictated by var side
-        # 2 - side is the corner point opposite side
-        tri1.set_merge_orientation_from_pt(side, line_intersection(tri1.get_lines()[side], l))
-        tri2.set_merge_orientation_from_pt(side, line_intersection(tri2.get_lines()[side], l))
-
-    elif tri1.size == 1 and tri2.size == 1:
-
-        assert tri1.corners[0] == tri1.corners[1] == tri1.corners[2]
-        assert tri2.corners[0] == tri2.corners[1] == tri2.corners[2]
-
-        pt1 = tri1.corners[0]
-        pt2 = tri2.corners[0]
-
-        if pt2 == vadd(pt1, (1, 0)) or pt1 == vadd(pt2, (1, 0)):
-            tri1.set_wanted_orientation(0)
-            tri2.set_wanted_orientation(0)
-        if pt2 == vadd(pt1, (1, -1)) or pt1 == vadd(pt2, (1, -1)):
-            tri1.set_wanted_orientation(1)
-            tri2.set_wanted_orientation(1)
-        if pt2 == vadd(pt1, (0, 1)) or pt1 == vadd(pt2, (0, 1)):
-            tri1.set_wanted_orientation(2)
-            tri2.set_wanted_orientation(2)
-
-    elif tri1.size > 1:
-        #print("heresy", side)
-        li = line_intersection(tri1.get_lines()[side], l)
-        #print("inter", li)
-        assert tri2.size == 1
-        tri1.set_merge_orientation_from_pt(side, li)
-        #print(tri1.wanted_orientation, tri1.corners[0])
-        tri2.set_wanted_orientation(tri1.wanted_orientation)
-        #print(tri2.wanted_orientation, tri2.corners[0])
-
-        #print(tri1.next_line)
-
-    elif tri2.size > 1:
-        assert tri1.size == 1
-        tri2.set_merge_orientation_from_pt(side, line_intersection(tri2.get_lines()[side], l))
-        tri1.set_wanted_orientation(tri2.wanted_orientation)
-
-    """
-    if side == 0:
-        l = (tri1.corners[2], tri2.corners[2])
-        tri1.set_merge_orientation_from_pt(0, line_intersection(tri1.get_lines(0), l))
-        tri2.set_merge_orientation_from_pt(0, line_intersection(tri2.get_lines(0), l))
-    elif side == 1:
-        l = (tri1.corners[1], tri2.corners[1])
-        tri1.set_merge_orientation_from_pt(1, line_intersection(tri1.get_lines(1), l))
-        tri2.set_merge_orientation_from_pt(1, line_intersection(tri2.get_lines(1), l))
-    """
-        
-
-class Triangle:
-    def __init__(self, v, dots):
-        self.dots = dots # this is so _in theory_ the triangle could be smart about points when there is excess
-        self.size = 1
-        self.current_line = set([v])
-        self.corners = [v, v, v]
-        # the line is determined by a number [0, 3), 0 1 2 mean left down ne,
-        # and remainder means dist of endpoint on that side, clockwise
-        self.set_orientation(rat(0, 1))
-        # self.wantedpoint = None
-        self.timer = 0
-
-    def get_lines(self, margin = 0):
-        half = rat(1, 2)
-        #print ("getting lines", margin)
-        left_line = vadd(self.corners[0], (-margin, -1)), vadd(self.corners[1], (-margin, 1))
-        ne_line = vadd(self.corners[1], (margin*half-1, margin*half+1)), vadd(self.corners[2], (margin*half+1, margin*half-1))
-        bottom_line = vadd(self.corners[2], (1, -margin)), vadd(self.corners[0], (-1, -margin))
-        #print(left_line, ne_line, bottom_line)
-        return left_line, bottom_line, ne_line
-
-    def contains(self, pos, margin = MARGIN):
-        lines = self.get_lines(margin)
-        return triangle_contains(lines, pos)
-
-    def intersects(self, other):
-        for c in self.corners:
-            if other.contains(c):
-                return True
-        for c in other.corners:
-            if self.contains(c):
-                return True
-        return False
-
-    def get_drawn_lines(self):
-        return [self.get_line_from_orientation(self.get_pretend_orientation())]
-
-    def get_thickened(self, margin):
-        if margin == 0 and self.size == 1:
-            return self.corners
-        #print(margin)
-        left_line, bottom_line, ne_line = self.get_lines(margin)
-        points = []
-        #print(left_line, #ne_line,
-            #sbottom_line)
-        points.append(line_intersection(left_line, bottom_line))
-        #print(points)
-        #ab = bbbb
-        points.append(line_intersection(left_line, ne_line))
-        points.append(line_intersection(ne_line, bottom_line))
-        return points
-
-    # calculate the dots that should be on here
-    # let's just to a triple
-    def calculate_line(self, ori):
-        #print(ori)
-        ori = ori % 3
-
-        # now we start at startpoint, and
-        # we do moves in order, as continuation take the one
-        # that is closer to line determined by ori
-        
-        side = int(ori)
-        if side == 0:
-            startpoint = self.corners[2]
-            moves = [(-1, 0), (-1, 1)]
-        if side == 1:
-            startpoint = self.corners[1]
-            moves = [(1, -1), (0, -1)]
-        if side == 2:
-            startpoint = self.corners[0]
-            moves = [(0, 1), (1, 0)]
-
-        # we need to distort the grid a little
-        right_move = vsub(moves[1], moves[0])
-        #print("size,2", self.size, right_move)
-        right_epsilon = smul(rat(1,20*self.size), right_move) # smul(rat(1,345987345*self.size), right_move)
-
-        #lerpo = ori - side
-        #a, b = side_to_endpoints_cw(side)
-        #av, bv = self.corners[a], self.corners[b]
-
-        # the line we actually want goes from startpoint to...
-        endpoint = self.point_from_orientation(ori)
-        #print(endpoint)
-        
-        # calculate length of projection on its complement (up to random order-preserving stretch)
-        def projdist(v):
-            # obviously we should just calc these once but it doesn't _really_ matter, and it's clearer this way maybe
-            relline = vsub(endpoint, startpoint) 
-            relv = vsub(v, startpoint)
-            rotline = rotate_left(relline)
-            return abs(dot(relv, rotline))
-
-        linepoints = []
-        currpoint = startpoint
-        linepoints.append(currpoint)
-        # currpoint = vadd(startpoint, (rat(1010010101,24359873489573248),rat(974984353,194875394275934857)))        
-
-        for i in range(self.size - 1):
-
-            neps = self.size - 2 - i
-            
-            dists = []
-            for m in moves:
-                p = vadd(vadd(currpoint, m), smul(neps, right_epsilon))
-                dists.append(projdist(p))
-            if dists[0] <= dists[1]:
-                currpoint = vadd(currpoint, moves[0])
-            else:
-                currpoint = vadd(currpoint, moves[1])
-                
-            linepoints.append(currpoint)
-
-        return set(linepoints)
-
-    def point_from_orientation(self, ori):
-        side = int(ori)
-        a, b = side_to_endpoints_cw(side)
-        av, bv = self.corners[a], self.corners[b]
-        t = ori - side
-        return vadd(av, smul(t, vsub(bv, av)))
-
-    def get_line_from_orientation(self, ori):
-        pt = self.point_from_orientation(ori)
-        side = int(ori)
-        return self.corners[2 - side], pt
-        
-    # given another triangle, are we buddies?
-    def neighbor_side(self, other, flip = False):
-        # is it on the left?
-        if other.corners[2][0] == self.corners[0][0] - 1 and other.corners[2][1] >= self.corners[0][1] and other.corners[2][1] <= self.corners[1][1] + 1:
-            return (flip, 0)
-        # btm?
-        if other.corners[1][1] == self.corners[0][1] - 1 and other.corners[1][0] >= self.corners[0][0] and other.corners[1][0] <= self.corners[2][0] + 1:
-            return (flip, 1)
-        # is it on the ne?
-        if sum(other.corners[0]) == sum(self.corners[1]) + 1 and other.corners[0][0] >= self.corners[1][0] and other.corners[0][1] >= self.corners[2][1]:
-            return (flip, 2)
-        if flip == True:
-            return None
-        else:
-            return other.neighbor_side(self, True)
-
-    def is_neighbor(self, other):
-        return self.neighbor_side(other) != None
-
-    def die(self, other):
-        #print(self.corners[0], "dije")
-        #print(other.corners[0])
-        c0 = self.corners[0]
-        c1 = self.corners[1]
-        c2 = self.corners[2]
-        if other.contains(c0) and other.contains(c1) and other.contains(c2):
-            self.set_wanted_orientation(self.orientation)
-        elif other.contains(c0):
-            self.set_wanted_orientation(2) # or 0
-        elif other.contains(c1):
-            self.set_wanted_orientation(1) # or 2
-        elif other.contains(c2):
-            self.set_wanted_orientation(0) # or 1
-        elif self.contains(other.corners[0]):
-            self.set_wanted_orientation(1)
-        elif self.contains(other.corners[1]):
-            self.set_wanted_orientation(0)
-        elif self.contains(other.corners[2]):
-            self.set_wanted_orientation(2)
-
-    def merge_with_murderer(self, murderer):
-        containeds = set()
-        minix = None
-        miniy = None
-        maxix = None
-        maxiy = None
-        for c in self.current_line:
-            if not murderer.contains(c):
-                continue
-            if minix == None or c[0] < minix:
-                minix = c[0]
-            if maxix == None or c[0] > maxix:
-                maxix = c[0]
-            if miniy == None or c[1] < miniy:
-                miniy = c[1]
-            if maxiy == None or c[1] > maxiy:
-                maxiy = c[1]
-        if minix == None:
-            return []
-
-        dems = []
-        
-        if self.orientation == 0:
-            #print("this")
-            # in this case, we can look at minix, maxix
-            if minix > self.corners[0][0]: # there is a leftmost triangle to construct
-                #print("yep", minix, self.corners[0])
-                left = Triangle((0, 0), self.dots)
-                left.corners = self.corners[:]
-                left.size = int(minix - self.corners[0][0])
-                left.calculate_corners_from_one(0)
-                #print(left.corners, "issu")
-                #print(left.size)
-                #print("I FAILE NOW")
-                left.calculate_line(0)
-                dems.append(left)
-
-            if maxix < self.corners[2][0]:
-                #print("yeb", maxix, self.corners[2])
-                right = Triangle((0, 0), self.dots)
-                right.corners = self.corners[:]
-                right.size = int(self.corners[2][0] - maxix)
-                right.calculate_corners_from_one(2)
-                #print(right.corners, "rittus")
-                dems.append(right)
-
-        if self.orientation == 1:
-            # in this case, we can look at minix, maxix
-            if minix > self.corners[1][0]: # there is a leftmost triangle to construct
-                left = Triangle((0, 0), self.dots)
-                left.corners = self.corners[:]
-                left.size = int(minix - self.corners[1][0])
-                left.calculate_corners_from_one(1)
-                dems.append(left)
-
-            if maxix < self.corners[2][0]:
-                right = Triangle((0, 0), self.dots)
-                right.corners = self.corners[:]
-                right.size = int(self.corners[2][0] - maxix)
-                right.calculate_corners_from_one(2)
-                dems.append(right)
-
-        if self.orientation == 2:
-            # in this case, we can look at minix, maxix
-            if miniy > self.corners[0][1]: # there is a btmmost triangle to construct
-                left = Triangle((0, 0), self.dots)
-                left.corners = self.corners[:]
-                left.size = int(miniy - self.corners[0][1])
-                left.calculate_corners_from_one(0)
-                dems.append(left)
-
-            if maxiy < self.corners[1][1]:
-                right = Triangle((0, 0), self.dots)
-                right.corners = self.corners[:]
-                right.size = int(self.corners[1][1] - maxiy)
-                right.calculate_corners_from_one(1)
-                dems.append(right)
-
-        for d in dems:
-            d.set_orientation(self.orientation)
-            #print(d.orientation, "orientation")
-
-            assert d.dots == self.dots
-            
-            #self.current_line = set([v])
-        #self.corners = [v, v, v]
-        # the line is determined by a number [0, 3), 0 1 2 mean left down ne,
-        # and remainder means dist of endpoint on that side, clockwise
-        #self.set_orientation(rat(0, 1))
-        # self.wantedpoint = None
-        #self.timer = 0
-        
-        #print(dems, "reto")
-
-        demsus = dems[:]
-        for k in self.dots:
-            if k == (0,2):
-                #print("keuhu")
-                pass
-            if self.contains(k):
-                #print("yes cont")
-                for q in demsus:
-                    if q.contains(k):
-                        #print("qqq", q)
-                        break
-                else:
-                    #print("herer")
-                    if not murderer.contains(k):
-                        #print("o o")
-                        dems.append(Triangle(k, self.dots))
-                        pass
-        #print("ok")
-
-        return dems
-
-    def set_orientation(self, ori):
-        assert type(ori) == fractions.Fraction or type(ori) == int
-        self.orientation = ori
-        self.pretend_orientation = ori
-        self.calculate_current_line()
-
-    def get_pretend_orientation(self):
-        return self.pretend_orientation % 3
-
-    # find an orientation between a and b such that line differs by exactly one from current_line
-    # we should find a, b such that diff at a is 0 and diff at b is 1: and diff betw a and b is accu
-    def technical_binary_thing(self, a, b, accu = 100):
-        
-        self.techno_counter += 1
-        cl = self.current_line
-        al = self.calculate_line(a)
-        bl = self.calculate_line(b)
-        adiff = al.symmetric_difference(cl)
-        bdiff = bl.symmetric_difference(cl)
-
-        #print("kiliman", a, len(adiff), b, len(bdiff))
-        
-        if len(adiff) == 0 and len(bdiff) == 2 and abs(b - a) < accu:
-            return b
-
-        if len(bdiff) == 0:
-            b = a + (b - a) * 2 # rat(5,2)
-            return self.technical_binary_thing(a, b, accu)
-
-        #print("vs", a, len(adiff), b, len(bdiff))
-        
-        assert len(adiff) == 0
-        mid = (a + b) / 2
-        midl = self.calculate_line(mid)
-        middiff = midl.symmetric_difference(cl)
-        
-        if len(middiff) == 0:
-            return self.technical_binary_thing(mid, b, accu)
-        else:
-            return self.technical_binary_thing(a, mid, accu)
-            
-    # naive binary search for turn that gives good line
-    def calculate_next_orientation(self):
-        curr = self.orientation
-        final = self.wanted_orientation
-
-        if len(self.calculate_line(curr).symmetric_difference(self.calculate_line(final))) == 0:
-            self.done = True
-            self.orientation = self.wanted_orientation
-            self.next_orientation = self.wanted_orientation
-            #self.next_line = self.calculate_line(self.next_orientation)
-            self.current_line = self.wanted_line
-            self.next_line = self.wanted_line
-            return
-        
-        # naively pick rotation direction based on distance
-        # I do not know if it's correct, but presumably close enough
-        for k in [self.wanted_orientation - 3, self.wanted_orientation + 3]:
-            if abs(k - curr) < abs(final - curr):
-                final = k
-
-        if final > curr:
-            inc = 1
-        else:
-            inc = -1
-        self.techno_counter = 0
-        self.next_orientation = self.technical_binary_thing(curr, curr + rat(inc, self.size))
-        #print(self.orientation, self.next_orientation, self.techno_counter)
-        self.calculate_next_line()
-
-    def calculate_next_line(self):
-        self.next_line = self.calculate_line(self.next_orientation)
-
-    def set_wanted_orientation(self, ori):
-        ori = rat(ori, 1)
-        self.wanted_orientation = ori
-        self.wanted_line = self.calculate_line(ori)
-        #print(self.current_line, "ami")
-        #print(self.final_line)
-        self.timer = 0
-        self.done = False
-
-        if self.wanted_line == self.current_line:
-            self.done = True
-            self.set_orientation(self.wanted_orientation)
-        self.calculate_next_orientation()
-
-    # def self.pretend_orientation = self.current_orientation
-            
-    def set_merge_orientation_from_pt(self, side, pt):
-        a, b = side_to_endpoints_cw(side)
-        #print("side to end", side, a, b)
-        av, bv = self.corners[a], self.corners[b]
-        at = unlerp(pt, av, bv)
-        #print(at, "is where it's at", (side + at) % 3)
-        self.set_wanted_orientation((side + at) % 3)
-        #print(self.corners[0], "wante", self.wanted_orientation)
-            
-    # rotate line; there should be a triangle move whenever sum of steps passes an integer
-    # we should rotate line, change our current dots, and
-    # also send back a list of triangle moves (it's always going to be a singleton or empty in this implementation)
-    def update_orientation(self, step):
-        #print("mkiliman")
-        self.timer += step
-        if self.done == True:
-            return []
-
-        moves = []
-        
-        while self.timer >= 1:
-            #print("timor")
-            self.timer -= 1
-            
-            if self.orientation != self.next_orientation:
-                cl = self.current_line
-                nl = self.next_line
-                sd = cl.symmetric_difference(nl)
-                sd = list(sd)
-                if len(sd) == 0:
-                    assert self.done
-                    return []
-                assert len(sd) == 2
-                if sd[0] not in self.current_line:
-                    sd = [sd[1], sd[0]]
-                moves.append(sd)
-
-            self.set_orientation(self.next_orientation)
-            self.calculate_current_line()
-            self.calculate_next_orientation()
-        self.pretend_orientation = slerp(self.timer, self.orientation, self.next_orientation)
-        
-        return moves
-
-    def calculate_current_line(self):
-        #print("calculating curne", self.orientation, repr(self.orientation))
-        self.current_line = self.calculate_line(self.orientation)
-
-    # size and this particular'th corner should be correct,
-    # then calculate other corners
-    def calculate_corners_from_one(self, corner):
-        s = self.size - 1
-        if corner == 0:
-            self.corners[1] = vadd(self.corners[0], (0, s))
-            self.corners[2] = vadd(self.corners[0], (s, 0))
-        if corner == 1:
-            self.corners[0] = vadd(self.corners[1], (0, -s))
-            self.corners[2] = vadd(self.corners[1], (s, -s))
-        if corner == 2:
-            self.corners[0] = vadd(self.corners[2], (-s, 0))
-            self.corners[1] = vadd(self.corners[2], (-s, s))
-
-    def reorientation_done(self):
-        return self.done
-
-    def normalization_generator(self):
-        self.current_height = None
-        self.top_excess = None
-
-        # move the xth column right
-        for x in range(self.size - 1):
-            #print(f"dealing with x = {x}")
-            self.height_of_current_column = self.size - 1 - x # discounting the bottom line
-            
-            # start up
-            # if x = 0, we are in the leftmost column, so height of column is size
-            # size-1 guys need to be moved, starting from topmost
-            self.dropped_count = 0
-            for y in range(self.size - x):
-                #print(f"dealing with y = {y}, basic drop")
-                #print(x, y, "going")
-                self.move_down_instead = False
-                if y == self.size - x - 1:
-                    self.move_down_instead = True
-                if vadd(self.corners[0], (x + 1, y)) in self.dots:
-                    self.move_down_instead = True
-                if not self.move_down_instead:
-                    # first we move the top bottom right
-                    a = (x, y)
-                    b = (x + 1, y)
-                    yield [(a, b)]
-                else:
-                    for z in reversed(list(range(self.dropped_count, y))):
-                        yield [((x, z+1), (x, z))]
-                        
-                    self.dropped_count += 1
-            #print("basic drop finished")
-
-            self.dropped_count -= 1
-
-            if x == 0:
-                self.current_height = self.dropped_count
-                self.top_excess = 0
-                
-            else:
-                if self.dropped_count < self.current_height:
-
-                    while self.dropped_count < self.current_height:
-
-                        if self.current_height <= self.height_of_current_column:
-
-                            #print(f"in the loop: dc {self.dropped_count}, ch {self.current_height}, te {self.top_excess}")
-                            if self.dropped_count < self.current_height - 1:
-                                
-                                if self.top_excess > 0:
-                                    for z in range(self.top_excess-1, x-2):
-                                        yield [((z+1, self.current_height), (z+1, self.current_height+1)),
-                                               ((z, self.current_height+1), (z+1, self.current_height))]
-                                
-                                    yield [((x-1, self.current_height), (x, self.current_height-1))]
-                                    yield [((x-2, self.current_height+1), (x-1, self.current_height))]
-                                    for y in reversed(list(range(self.dropped_count+1, self.current_height-1))):
-                                        yield [((x, y+1), (x, y))]
-
-                                    self.top_excess -= 1
-
-                                else:
-
-                                    yield [((x-1, self.current_height), (x, self.current_height-1))]
-                                    for y in reversed(list(range(self.dropped_count+1, self.current_height-1))):
-                                        yield [((x, y+1), (x, y))]
-                                    #print("case A")
-                                    self.top_excess = x-1
-                                    self.current_height -= 1
-
-
-                            else: # difference is 1!!!
-
-                                if self.top_excess > 0:
-                                    #print("heresadf")
-                                    for z in range(self.top_excess-1, x-2):
-                                        yield [((z+1, self.current_height), (z+1, self.current_height+1)),
-                                               ((z, self.current_height+1), (z+1, self.current_height))]
-
-                                    yield [((x, self.current_height-1), (x, self.current_height))]
-                                    yield [((x-1, self.current_height), (x, self.current_height-1))]
-                                    yield [((x-2, self.current_height+1), (x-1, self.current_height))]
-
-                                    self.top_excess -= 1
-
-                                else: # top excess = 0
-                                    #print("case B")
-                                    self.top_excess = x
-                                    self.current_height -= 1
-                                    
-                            self.dropped_count += 1
-                                    
-                        elif self.dropped_count < self.height_of_current_column:
-                            # self.dropped_count < self.current_height AND
-                            # self.current_height > self.height_of_current_column <-- really just this
-                            ell = self.size - (self.current_height + 1) # length of excess row
-                            if self.top_excess > 0:
-                                # step 1: move excess horizontally
-                                # use coordinate of destination
-
-                                # final destination = (ell-1, self.current_height+1)
-                                for xx in range(self.top_excess, ell):
-                                    yield [((xx, self.current_height), (xx, self.current_height+1)),
-                                           ((xx-1, self.current_height+1), (xx, self.current_height))]
-                                    
-                                # step 2: move stuff diagonally
-                                # coord of lowest destination (x, self.height_of_current_column)
-                                # coord of topmost is (ell, self.current_height)
-                                num_steps = self.current_height - self.height_of_current_column + 1
-                                for i in range(num_steps):
-                                    yield [((x-1-i, self.height_of_current_column+1+i), (x-i, self.height_of_current_column+i))]
-                                self.top_excess -= 1
-
-                            else:
-                                num_steps = self.current_height - self.height_of_current_column
-                                for i in range(num_steps):
-                                    yield [((x-1-i, self.height_of_current_column+1+i), (x-i, self.height_of_current_column+i))]
-
-                                self.current_height -= 1
-                                self.top_excess = ell
-
-                            # step 3: drop stuff
-                            # we have dot at (x, hocc), need to move to (x, self.dropped_count+1)
-                            for y in reversed(list(range(self.dropped_count+1, self.height_of_current_column))):
-                                yield [((x, y+1), (x, y))]
-                            
-                            self.dropped_count += 1
-
-                        else:
-                            break
-                                
-                                
-                            
-                    
-                else: # self.dropped_count >= self.current_height:
-                    
-                    while self.dropped_count > self.current_height:
-                        yield [((x, self.current_height), (x-1, self.current_height+1))]
-                        for y in range(self.current_height, self.dropped_count):
-                            yield [((x, y+1), (x, y))]
-                        self.dropped_count -= 1
-
-                        for xx in reversed(list(range(self.top_excess, x-1))):
-                            yield [((xx+1, self.current_height), (xx, self.current_height+1)),
-                                   ((xx+1, self.current_height+1), (xx+1, self.current_height))]
-
-                        self.top_excess += 1
-                        #print(f"moment {self.top_excess}")
-                        if self.top_excess == x and self.dropped_count > self.current_height:
-                            self.top_excess = 0
-                            self.current_height += 1
-                        
-
-        self.normalized = True
-        self.set_orientation(0)
-        while True:
-            yield []
-
-    def start_normalization(self):
-        self.normalization_phase = ORIENT
-        self.set_wanted_orientation(2)
-        self.normalized = False
-
-    def update_normalization(self, step):
-        if self.normalization_phase == ORIENT:
-            upd = self.update_orientation(step)
-            if self.reorientation_done():
-                self.normalization_phase = FALL
-                self.normafun = self.normalization_generator()
-            return upd
-        else:
-            #self.normalized = True
-            self.timer += step
-            upds = []
-            while self.timer >= 1:
-                self.timer -= 1
-                ext = next(self.normafun)
-                for k in ext:
-                    upds.append(tuple(map(lambda a:vadd(self.corners[0], a), k)))
-                #print(f"current height {self.current_height}; top_excess {self.top_excess}; dropped_count {self.dropped_count}")
-                
-            #print(upds)
-            return upds
-
-    def normalization_done(self):
-        return self.normalized
-
-    
-
-def merge_triangles(tri1, tri2):
-    assert tri1.done and tri2.done
-    flip, side = tri1.neighbor_side(tri2)
-    if flip:
-        return merge_triangles(tri2, tri1)
-    # get lines for assertion purposes
-    lines1 = tri1.current_line
-    lines2 = tri2.current_line
-
-    #print("MERGE FINISH")
-    #print(tri1.corners, tri1.orientation)
-    #print(tri2.corners, tri2.orientation)
-    
-    # now tri1 should be made larger by size of tri2, in direction side
-    t = Triangle((0, 0), tri1.dots) # (0, 0) is cuz don't matter
-    t.size = tri1.size + tri2.size
-    t.set_orientation(tri1.orientation)
-    if tri1.size > 1 and tri2.size > 1:
-        assert tri1.orientation == tri2.orientation
-    opposite_point = 2 - side
-    t.corners = [None, None, None]
-    t.corners[opposite_point] = tri1.corners[opposite_point]
-    t.calculate_corners_from_one(2 - side)
-    t.calculate_current_line()
-
-    #print(t.corners, t.orientation, "result")
-    #print(t.current_line)
-    #print(t.calculate_line(t.orientation))
-
-    return t
-
-# scalar lerp
-def slerp(t, a, b):
-    return a + t*(b - a)
-
-# given p, a, b, calculate (some) t such that p = a + t(b - a)
-def unlerp(p, a, b):
-    if a[0] == b[0] and a[1] == b[1]:
-        assert p == a
-        return 0
-    if a[0] == b[0]:
-        return unlerp((p[1], p[0]), (a[1], a[0]), (b[1], b[0])) # we can do any affine transformation to the triple clearly
-    """
-    p = a + t(b - a)
-    px = ax + t(bx - ax)
-    (px - ax)/(bx - ax) = t
-    """
-    return (p[0] - a[0])/(rat(b[0], 1) - rat(a[0], 1))
-
-def side_to_endpoints_cw(side):
-    side = side % 3
-    if side == 0:
-        return 0, 1
-    if side == 1:
-        return 2, 0
-    if side == 2:
-        return 1, 2
-
-def apply_random(dots):
-    d = random.choice(list(dots))
-    #print(d)
-    tri = [(0,0), (1,0), (0,1)]
-    idx = random.randint(0, 2)
-    tri = set(map(lambda a:vadd(d, vsub(a, tri[idx])), tri))
-    tri.remove(d)
-    #print(tri)
-    tri = list(tri)
-    random.shuffle(tri)
-    assert len(tri) == 2 and d not in tri
-    if tri[0] in dots and tri[1] not in dots:
-        #print("did")
-        dots.remove(tri[0])
-        dots.add(tri[1])
-    else:
-        #print("sad")
-        pass
+# the moves of FALL that turbo applies at a time with batch_moves
+TURBO_CHUNK = 4096
+# from this many random steps per frame on we do them in batches with random_walk
+RANDOM_BATCH = 64
+# random_walk keeps a grid of the whole bounding box of the dots, so not if it's bigger
+# than this many cells (spread out dots get stepped one by one)
+RANDOM_WALK_CELLS = 1 << 22
+# the lattice points are only drawn when they're at least this many pixels apart
+LATTICE_MIN_SCALE = 8
+# the size of the random board that autoplay_main plays by default
+AUTOPLAY_SIZE = 20
 
 s = """
 10000000
@@ -1001,14 +141,8 @@ def calculate_bounds(dots):
             size = sum(d) - bottom
     return left, bottom, size + 1
 
-#leftbound, bottombound, size = calculate_bounds(dots)
-#print(leftbound, bottombound, size)
-leftbound = 0
-bottombound = 0
-size = 20
-
-dots = set(map(lambda a:(rat(a[0], 1), rat(a[1], 1)), dots))
-triangles = set(Triangle(v, dots) for v in dots)
+dots = Board(dots)
+triangles = TriangleSet(Triangle(v, dots) for v in dots)
 
 
 
@@ -1105,24 +239,9 @@ def to_logical(v):
     return rat(v[0]), rat(yinv)
 
 
-# check that we can move from a to b
-def pivot_exists(dots, a, b):
-    if b == vadd(a, (0, 1)):
-        return vadd(a, (1, 0)) in dots
-    if b == vadd(a, (1, 0)):
-        return vadd(a, (0, 1)) in dots
-    if b == vadd(a, (0, -1)):
-        return vadd(a, (1, -1)) in dots
-    if b == vadd(a, (1, -1)):
-        return vadd(a, (0, -1)) in dots
-    if b == vadd(a, (-1, 0)):
-        return vadd(a, (-1, 1)) in dots
-    if b == vadd(a, (-1, 1)):
-        return vadd(a, (-1, 0)) in dots
-
 # given logical position, find nearest lattice point, assuming grid is reasonably non-distorted...
 def nearest_logical(pos):
-    discrete = int(pos[0]), int(pos[1])
+    discrete = math.floor(pos[0]), math.floor(pos[1])
     nearest = None
     nearest_dist = None
     for x in range(-5, 6):
@@ -1134,17 +253,184 @@ def nearest_logical(pos):
                 nearest = v
     return nearest
 
-def is_in_area(vec):
-    x,y = vec
-    if not x in range(leftbound, leftbound + size):
-        return False
-    if not y in range(bottombound, bottombound + size):
-        return False
-    if (x-leftbound) + (y-bottombound) > size - 1:
-        return False
-    return True
+# the number of cells in the box of the tiles of the board that have dots, which is at
+# least as big as the bounding box of the dots
+def box_cells(dots):
+    bounds = dots.tile_bounds()
+    if bounds == None:
+        return 0
+    x0, y0, x1, y1 = bounds
+    return (x1 - x0 + 1)*(y1 - y0 + 1)
+
+# the lattice (background and the small points) is drawn once onto its own surface and
+# only redrawn when the view moves or zooms. after that a frame only repaints the screen
+# rects where something changed: around the dots that moved (dots.changes), around
+# triangles that came or went (triangles.changes) or whose colour or line changed, where
+# the mouse triangle was, and the text. those rects are pushed with display.update
+class Renderer:
+    # more dirty rects than this and we just repaint everything
+    MAX_RECTS = 300
+
+    def __init__(self, screen, font):
+        self.screen = screen
+        self.font = font
+        self.lattice = pygame.Surface(screen.get_size()).convert()
+        self.scene = pygame.Surface(screen.get_size()).convert()
+        self.view = None
+        self.dots = None
+        self.triangles = None
+        self.show_triangles = None
+        self.drawn = {}
+        self.moused = None
+        self.texts = []
+        self.texts_drawn = []
+        self.rects = []
+        self.full = True
+
+    # the lattice points that are on the screen. the board goes on forever, so zoomed
+    # out far enough they'd just be a grey mess and we leave them out
+    def draw_lattice(self):
+        self.lattice.fill((250, 250, 250))
+        if scale < LATTICE_MIN_SCALE:
+            return
+        x0, y0, x1, y1 = self.logical_bounds(self.screen.get_rect())
+        w = self.screen.get_width()
+        # a row of the lattice is evenly spaced on the screen, so just the part of it
+        # that's on the screen
+        for y in range(y0, y1 + 1):
+            sx, sy = to_screen((0, y))
+            for x in range(math.ceil((-2 - sx)/scale), math.floor((w + 2 - sx)/scale) + 1):
+                pygame.draw.circle(self.lattice, (0, 0, 0), (sx + x*scale, sy), 1)
+
+    # the screen rect of a dot (with a pixel to spare)
+    def dot_rect(self, v):
+        x, y = to_screen(v)
+        return pygame.Rect(int(x) - 6, int(y) - 6, 13, 13)
+
+    def bounding_rect(self, pts):
+        pts = list(map(to_screen, pts))
+        left = int(min(p[0] for p in pts)) - 3
+        top = int(min(p[1] for p in pts)) - 3
+        right = int(max(p[0] for p in pts)) + 3
+        bottom = int(max(p[1] for p in pts)) + 3
+        return pygame.Rect(left, top, right - left + 1, bottom - top + 1)
+
+    def triangle_rect(self, t):
+        return self.bounding_rect(t.get_thickened(MARGIN))
+
+    def moused_rect(self, v):
+        return self.bounding_rect([v, vadd(v, (0, 1)), vadd(v, (1, 0))])
+
+    # the lattice coordinates x0, y0, x1, y1 of a box that has everything drawn in rect
+    def logical_bounds(self, rect):
+        corners = [to_logical(p) for p in (rect.topleft, rect.topright, rect.bottomleft, rect.bottomright)]
+        # a dot is 4 pixels, that's a lot of cells when zoomed out
+        pad = 1 + math.ceil(6/scale)
+        x0 = math.floor(min(c[0] for c in corners)) - pad
+        y0 = math.floor(min(c[1] for c in corners)) - pad
+        x1 = math.ceil(max(c[0] for c in corners)) + pad
+        y1 = math.ceil(max(c[1] for c in corners)) + pad
+        return x0, y0, x1, y1
+
+    def draw_triangle(self, t, color):
+        for l in t.get_drawn_lines():
+            pygame.draw.lines(self.scene, (0, 0, 0), True, list(map(to_screen, l)))
+        pygame.draw.lines(self.scene, color, True, list(map(to_screen, t.get_thickened(MARGIN))))
+
+    # redraw everything inside rect. pygame draws a line a bit differently when it has to
+    # clip it, so instead of clipping we draw the whole things on self.scene (whatever
+    # lands outside rect there is garbage) and copy just rect to the screen
+    def paint(self, rect, styles, texts):
+        scene = self.scene
+        scene.blit(self.lattice, rect.topleft, rect)
+        if self.moused != None:
+            m = self.moused
+            pygame.draw.lines(scene, (150, 150, 150), True, list(map(to_screen, [m, vadd(m, (0, 1)), vadd(m, (1, 0))])))
+        x0, y0, x1, y1 = self.logical_bounds(rect)
+        for d in self.dots.in_rect(x0, y0, x1, y1):
+            pygame.draw.circle(scene, (0, 0, 0), to_screen(d), 4)
+        if self.show_triangles:
+            for t in self.triangles.in_rect(x0, y0, x1, y1):
+                self.draw_triangle(t, styles.get(t, (0, 0, 0)))
+        for text, textpos in texts:
+            if textpos.colliderect(rect):
+                scene.blit(text, textpos)
+        self.screen.blit(scene, rect.topleft, rect)
+
+    # styles has the colour of every triangle that isn't just black or whose line is
+    # turning (those are black in styles), moused is the btm-left corner of the
+    # highlighted unit triangle or None, lines are the lines of text at the top left
+    def draw(self, dots, triangles, show_triangles, styles, moused, lines):
+        rects = self.rects
+        view = (xpos, ypos, scale)
+        if view != self.view:
+            self.view = view
+            self.draw_lattice()
+            self.full = True
+        if dots is not self.dots:
+            self.dots = dots
+            dots.changes = []
+            self.full = True
+        if triangles is not self.triangles:
+            self.triangles = triangles
+            triangles.changes = []
+            self.full = True
+        if show_triangles != self.show_triangles:
+            self.show_triangles = show_triangles
+            self.full = True
+
+        if not self.full:
+            rects.extend(map(self.dot_rect, dots.changes))
+            if show_triangles:
+                rects.extend(map(self.triangle_rect, triangles.changes))
+        dots.changes.clear()
+        triangles.changes.clear()
+
+        # a triangle needs redrawing if how it looks is different from last time
+        drawn = {}
+        for t, color in styles.items():
+            drawn[t] = color, t.get_pretend_orientation()
+        if show_triangles and not self.full:
+            for t in set(drawn) | set(self.drawn):
+                if drawn.get(t) != self.drawn.get(t) and t in triangles:
+                    rects.append(self.triangle_rect(t))
+        self.drawn = drawn
+
+        if moused != self.moused and not self.full:
+            for m in [moused, self.moused]:
+                if m != None:
+                    rects.append(self.moused_rect(m))
+        self.moused = moused
+
+        texts = []
+        for i, line in enumerate(lines):
+            text = self.font.render(line, 1, (10, 10, 10))
+            textpos = text.get_rect()
+            textpos.left = 30
+            textpos.top = 30 + 30*i
+            texts.append((text, textpos))
+        if lines != self.texts:
+            rects.extend(textpos for text, textpos in self.texts_drawn)
+            rects.extend(textpos for text, textpos in texts)
+        self.texts = lines
+        self.texts_drawn = texts
+
+        # things that changed off the screen don't need anything
+        screen_rect = self.screen.get_rect()
+        rects = [r.clip(screen_rect) for r in rects if r.colliderect(screen_rect)]
+        if self.full or len(rects) > self.MAX_RECTS:
+            self.paint(screen_rect, styles, texts)
+            pygame.display.flip()
+        else:
+            for r in rects:
+                self.paint(r, styles, texts)
+            pygame.display.update(rects)
+        self.rects = []
+        self.full = False
 
-def main():
+# logfile is where to write a movelog of the merging and normalizing, if anywhere.
+# with replayfile, we play that movelog instead. at most fps frames per second
+def main(logfile = None, replayfile = None, fps = FPS):
 
     global chosentriangle, xpos, ypos, scale, speed, triangles, dots
     
@@ -1153,29 +439,79 @@ def main():
     screen = pygame.display.set_mode((width, height))
     pygame.display.set_caption('Basic Pygame program')
 
-    # Fill background
-    background = pygame.Surface(screen.get_size())
-    background = background.convert()
-    background.fill((250, 250, 250))
-
     #font = pygame.font.SysFont('system', 36)
     font = pygame.font.SysFont('arial', 36)
 
-    # Blit everything to the screen
-    screen.blit(background, (0, 0))
-    pygame.display.flip()
+    renderer = Renderer(screen, font)
+    batch_moves = load_batch_moves()
 
     action = SOLITAIRE
     randomization = False
     random_steps = 1
+    random_timer = 0
+    # the random_walk.RandomWalk of the dots while there are many random steps
+    walk = None
+    # auto-play: the AutoPlay picking merges while it's running, what's left to
+    # normalize at the end, and the moves and time so far
+    autoplayer = None
+    autoplay_text = None
+
+    log = None
+    if logfile != None:
+        log = movelog.MoveLog(logfile, "i")
+
+    replay = None
+    if replayfile != None:
+        action = REPLAY
+        replay = movelog.Replay(movelog.MoveLogReader(replayfile), dots)
+        replay_playing = True
+        replay_timer = 0
+
+    # frame timing: (seconds for events, simulation, drawing, the whole frame with the
+    # waiting, moves) of the last frames
+    timings = collections.deque(maxlen = TIMING_FRAMES)
+    show_timings = False
+    profiler = None
+    # where the last profile went, for the overlay
+    profile_text = None
+
+    turbo = False
+    finish = False
+
+    clock = pygame.time.Clock()
+    # the seconds the last frame took, and if nothing is going on (then we wait)
+    frame_time = 1/SPEED_FPS
+    idle = False
 
     # Event loop
     while 1:
 
+        events = []
+        waited = idle
+        if idle:
+            events.append(pygame.event.wait(IDLE_WAIT_MS))
+
+        frame_start = time.perf_counter()
+        frame_moves = 0
+        if profiler != None:
+            profile_frames -= 1
+            if profile_frames < 0:
+                profiler.disable()
+                profile_file = time.strftime("profile-%Y%m%d-%H%M%S.pstats")
+                profiler.dump_stats(profile_file)
+                profile_text = f"wrote the profile of {PROFILE_FRAMES} frames to {profile_file}"
+                profiler = None
+
         do_a_step = False
+        # how far the simulation goes in this frame, in 1/SPEED_FPS seconds
+        ticks = rat(round(1000*SPEED_FPS*min(frame_time, MAX_FRAME_TIME)), 1000)
         
-        for event in pygame.event.get():
+        for event in events + pygame.event.get():
             if event.type == QUIT:
+                if log != None:
+                    log.close()
+                if replay != None:
+                    replay.reader.close()
                 pygame.quit()
                 return
 
@@ -1184,18 +520,18 @@ def main():
                     clickedtriangle = None
                     pos = pygame.mouse.get_pos()
                     pos = to_logical(pos)
-                    for t in triangles:
-                        if t.contains(pos, MARGIN):
-                            clickedtriangle = t
+                    clickedtriangle = triangles.at(pos)
                     if event.button == 1:
                         if clickedtriangle == None:
                             chosentriangle = None
                         elif chosentriangle == None:
                             chosentriangle = clickedtriangle
-                        elif chosentriangle.is_neighbor(clickedtriangle):
+                        elif clickedtriangle in triangles.neighbors(chosentriangle):
                             action = MERGING
                             tri1 = chosentriangle
                             tri2 = clickedtriangle
+                            if log != None:
+                                log.mark(movelog.MERGE, merge_footprint(tri1, tri2))
                             set_merge_orientations(tri1, tri2)
                             #print(tri1.wanted_orientation, "want")
                             #print(tri2.wanted_orientation, "cant")
@@ -1205,24 +541,73 @@ def main():
                         if clickedtriangle != None:
                             action = NORMALIZE
                             tri1 = clickedtriangle
+                            if log != None:
+                                log.mark(movelog.NORMALIZE, tri1)
                             tri1.start_normalization()
 
             if event.type == pygame.KEYDOWN:
                 if event.key == K_SPACE:
                     do_a_step = True
+
+                if action == REPLAY:
+                    # a hundredth of the log, but at least a move
+                    jump = max(1, replay.moves//100)
+                    if event.key == K_SPACE:
+                        replay_playing = not replay_playing
+                    if event.key == K_PERIOD:
+                        replay_playing = False
+                        replay.seek(replay.pos + 1)
+                    if event.key == K_COMMA:
+                        replay_playing = False
+                        replay.seek(replay.pos - 1)
+                    if event.key == K_RIGHTBRACKET:
+                        replay.seek(replay.pos + jump)
+                    if event.key == K_LEFTBRACKET:
+                        replay.seek(replay.pos - jump)
+                    if event.key == K_HOME:
+                        replay.seek(0)
+                    if event.key == K_END:
+                        replay.seek(replay.moves)
+                if event.key in [K_1, K_2, K_3, K_4] and action in idles:
+                    autoplayer = None
+                    autoplay_text = None
                 if event.key == K_1:
                     if action in idles:
                         action = SOLITAIRE
                 if event.key == K_2:
                     if action in idles:
                         action = EDITING
-                if event.key == K_3:
+                if event.key == K_3 or event.key == K_4:
                     if action in idles:
                         action = IDLE
                         randomization = False
                         
-                        dots = set(map(lambda a:(rat(a[0], 1), rat(a[1], 1)), dots))
-                        triangles = set(Triangle(v, dots) for v in dots)
+                        triangles = TriangleSet(Triangle(v, dots) for v in dots)
+                        if log != None:
+                            log.start(dots)
+                if event.key == K_4 and action == IDLE:
+                    autoplayer = AutoPlay(triangles)
+                    to_normalize = None
+                    autoplay_moves = 0
+                    autoplay_start = time.perf_counter()
+
+                if event.key == K_u:
+                    turbo = not turbo
+                if event.key == K_RETURN:
+                    finish = True
+
+                if event.key == K_o:
+                    show_timings = not show_timings
+                if event.key == K_p and profiler == None:
+                    profiler = cProfile.Profile()
+                    profile_frames = PROFILE_FRAMES
+                    profiler.enable()
+
+                if event.key == K_i:
+                    if stats.enabled:
+                        stats.disable()
+                    else:
+                        stats.enable()
 
                 if event.key == K_r and action in [EDITING, SOLITAIRE]:
                     randomization = not randomization
@@ -1269,7 +654,7 @@ def main():
         if action == SOLITAIRE:
             pos = pygame.mouse.get_pos()
             pos = to_logical(pos)
-            poso = int(pos[0]), int(pos[1])
+            poso = math.floor(pos[0]), math.floor(pos[1])
             if sum(vsub(pos, poso)) < 1:
                 moused_triangle = poso
             #print(pos)
@@ -1281,167 +666,278 @@ def main():
 
             vec = nearest_logical(pos)
             
-            if mpress[0] and is_in_area(vec):
+            if mpress[0]:
                 dots.add(vec)
             if mpress[2]:
                 dots.discard(vec)
 
+        # these go by ticks too, so they're as fast at any frame rate
         keys = pygame.key.get_pressed()
         if keys[K_UP]:
-            ypos -= 0.01
+            ypos -= 0.01*ticks
         if keys[K_DOWN]:
-            ypos += 0.01
+            ypos += 0.01*ticks
         if keys[K_LEFT]:
-            xpos -= 0.01
+            xpos -= 0.01*ticks
         if keys[K_RIGHT]:
-            xpos += 0.01
+            xpos += 0.01*ticks
         if keys[K_a]:
-            scale *= 0.99
+            scale *= 0.99**ticks
         if keys[K_z]:
-            scale /= 0.99
+            scale /= 0.99**ticks
         if keys[K_s]:
-            speed /= rat(99, 100)
+            speed /= rat(0.99**ticks).limit_denominator(10000)
         if keys[K_x]:
-            speed *= rat(99, 100)
+            speed *= rat(0.99**ticks).limit_denominator(10000)
                         
+        events_done = time.perf_counter()
+
         # movement
 
         if (action == SOLITAIRE or action == EDITING) and randomization:
-            for r in range(random_steps):
-                apply_random(dots)
-
-        updates = []
-
-        if action == MERGING:
-            upd1 = tri1.update_orientation(speed)
-            upd2 = tri2.update_orientation(speed)
-            updates = upd1 + upd2
-
-        if action == KILL:
-            for t in killeds:
-                updates.extend(t.update_orientation(speed))
-
-        if action == NORMALIZE and (do_a_step or True):
-            updates.extend(tri1.update_normalization(speed))
-
-        for m in updates:
-            #print(m, "actually")
-            if l == []:
-                continue
-            a, b = m[0], m[1]
-            #print(a, "moves to", b)
-            assert pivot_exists(dots, a, b)
-            assert a in dots
-            if a in dots and b in dots:
-                continue
-            elif b not in dots:
+            random_timer += random_steps*ticks
+            count = int(random_timer)
+            random_timer -= count
+            if random_walk != None and count >= RANDOM_BATCH and box_cells(dots) <= RANDOM_WALK_CELLS:
+                # the walk stays as long as nothing else changed the dots (everything
+                # that changed since the last frame is in dots.changes)
+                if walk == None or dots.changes != []:
+                    walk = random_walk.RandomWalk(dots, random.getrandbits(64))
+                walk.apply(dots, count)
+            else:
+                walk = None
+                for r in range(count):
+                    apply_random(dots)
+        else:
+            walk = None
+
+        if action == REPLAY and replay_playing:
+            replay_timer += speed*ticks
+            while replay_timer >= 1 and replay.pos < replay.moves:
+                replay_timer -= 1
+                replay.step()
+                frame_moves += 1
+            replay_timer = min(replay_timer, 1)
+
+        # the operations go at speed moves per tick, or in turbo one move at a time for
+        # TURBO_BUDGET seconds of the frame (and auto-play keeps going), or to the end of
+        # the operation in one frame when finishing. the moves are the same either way
+        turbo_until = None
+        if turbo:
+            turbo_until = time.perf_counter() + TURBO_BUDGET
+        if finish:
+            turbo_until = math.inf
+            finish = False
+        first = True
+        while True:
+            # auto-play does the clicking
+            if action == IDLE and autoplayer != None and (first or turbo):
+                pair = autoplayer.next_merge()
+                if pair != None:
+                    action = MERGING
+                    tri1, tri2 = pair
+                    if log != None:
+                        log.mark(movelog.MERGE, merge_footprint(tri1, tri2))
+                    set_merge_orientations(tri1, tri2)
+                else:
+                    if to_normalize == None:
+                        to_normalize = autoplayer.to_normalize()
+                    if len(to_normalize) > 0:
+                        action = NORMALIZE
+                        tri1 = to_normalize.pop(0)
+                        if log != None:
+                            log.mark(movelog.NORMALIZE, tri1)
+                        tri1.start_normalization()
+                    else:
+                        autoplayer = None
+
+            if stats.enabled:
+                step_start = time.perf_counter()
+                step_action = action
+
+            step = speed*ticks if turbo_until == None else 1
+            updates = []
+            batch = None
+
+            if action == MERGING:
+                upd1 = tri1.update_orientation(step)
+                upd2 = tri2.update_orientation(step)
+                updates = upd1 + upd2
+
+            if action == KILL:
+                for t in killeds:
+                    updates.extend(t.update_orientation(step))
+
+            if action == NORMALIZE and turbo_until != None and batch_moves != None and tri1.normalization_phase == FALL:
+                batch = batch_moves.translate(tri1.normalization_chunk(TURBO_CHUNK), tri1.corners[0])
+                apply_moves(dots, batch, log)
+            elif action == NORMALIZE and (do_a_step or True):
+                updates.extend(tri1.update_normalization(step))
+
+            for m in updates:
+                #print(m, "actually")
                 # could add some animation ofc
-                dots.remove(a)
-                dots.add(b)
-
-        if action == MERGING:
-            if tri1.reorientation_done() and tri2.reorientation_done():
-                tri = merge_triangles(tri1, tri2)
-                triangles.remove(tri1)
-                triangles.remove(tri2)
-                triangles.add(tri)
-
-                killeds = []
-                for t in triangles:
-                    if t != tri:
-                        if t.intersects(tri):
-                            t.die(tri)
-                            killeds.append(t)
-
+                apply_move(dots, m)
+                if log != None:
+                    log.move(m)
+            step_moves = len(updates) if batch is None else len(batch)
+            frame_moves += step_moves
+            if stats.enabled and action in STAT_KINDS:
+                stats.add("moves/" + STAT_KINDS[action], step_moves)
+
+            if autoplayer != None:
+                autoplay_moves += step_moves
+                autoplay_text = f'auto-play: {autoplay_moves} moves, {time.perf_counter() - autoplay_start:.1f} s'
+
+            if action == MERGING:
+                if tri1.reorientation_done() and tri2.reorientation_done():
+                    tri = merge_triangles(tri1, tri2)
+                    triangles.remove(tri1)
+                    triangles.remove(tri2)
+                    triangles.add(tri)
+                    if autoplayer != None:
+                        autoplayer.add([tri])
+
+                    killeds = triangles.overlapping(tri)
+                    for t in killeds:
+                        t.die(tri)
+                        if log != None:
+                            log.mark(movelog.KILL, t)
+
+                    if len(killeds) == 0:
+                        action = IDLE
+                    else:
+                        murderer = tri
+                        action = KILL
+                    chosentriangle = None
+
+            elif action == KILL:
+                for t in killeds[:]:
+                    if t.reorientation_done():
+                        pieces = t.merge_with_murderer(murderer)
+                        triangles.update(pieces)
+                        triangles.remove(t)
+                        killeds.remove(t)
+                        if autoplayer != None:
+                            autoplayer.add(pieces)
                 if len(killeds) == 0:
                     action = IDLE
-                else:
-                    murderer = tri
-                    action = KILL
-                chosentriangle = None
 
-        elif action == KILL:
-            for t in killeds[:]:
-                if t.reorientation_done():
-                    triangles.update(t.merge_with_murderer(murderer))
-                    triangles.remove(t)
-                    killeds.remove(t)
-            if len(killeds) == 0:
-                action = IDLE
+            elif action == NORMALIZE:
+                if tri1.normalization_done():
+                    action = IDLE
 
-        elif action == NORMALIZE:
-            if tri1.normalization_done():
-                action = IDLE
+            if stats.enabled and step_action in STAT_KINDS:
+                stats.add("seconds/" + STAT_KINDS[step_action], time.perf_counter() - step_start)
 
-        # drawing
+            first = False
+            if turbo_until == None or time.perf_counter() >= turbo_until:
+                break
+            if action not in STAT_KINDS and not (action == IDLE and turbo and autoplayer != None):
+                break
 
-        screen.blit(background, (0, 0))
+        simulation_done = time.perf_counter()
 
+        # drawing
 
-        if action == SOLITAIRE and moused_triangle != None:
-            mous_phys = to_screen(moused_triangle)
-            mous_phys_up = to_screen(vadd(moused_triangle, (0,1)))
-            mous_phys_right = to_screen(vadd(moused_triangle, (1,0)))
-            # pygame.draw.circle(screen, (0,0,0), mous_phys, 3)
-            pygame.draw.line(screen, (150,150,150), mous_phys, mous_phys_up, 1)
-            pygame.draw.line(screen, (150,150,150), mous_phys_up, mous_phys_right, 1)
-            pygame.draw.line(screen, (150,150,150), mous_phys_right, mous_phys, 1)
-            
-        for x in range(leftbound, leftbound + size):
-            for y in range(bottombound, bottombound + size):
-                if (x-leftbound) + (y-bottombound) > size - 1:
-                    continue
-                r = 1
-                if (x, y) in dots: r = 4
-                pygame.draw.circle(screen, (0, 0, 0), to_screen((x, y)), r) 
-
-
-        for t in triangles:
-            if action == SOLITAIRE or action == EDITING:
-                continue
-
-            ls = t.get_drawn_lines()
-            for l in ls:
-                pygame.draw.lines(screen, (0, 0, 0), True, list(map(to_screen, l)))
-                pass
-            
-            pts = t.get_thickened(MARGIN)
-            color = (0, 0, 0)
-            if action == IDLE:
-                if chosentriangle == t:
-                    color = (255, 0, 0)
-                elif chosentriangle and chosentriangle.is_neighbor(t):
-                    color = (0, 255, 0)
-            elif action == MERGING:
-                if tri1 == t or tri2 == t:
-                    color = (0, 0, 255)
-                    
-            pygame.draw.lines(screen, color, True, list(map(to_screen, pts)))
-
-        def texty(xx, yy, tex):
-            text = font.render(tex, 1, (10, 10, 10))
-            textpos = text.get_rect()
-            textpos.left = xx #background.get_rect().centerx
-            textpos.top = yy
-            screen.blit(text, textpos)
-        
+        styles = {}
+        if action == IDLE and chosentriangle != None:
+            for t in triangles.neighbors(chosentriangle):
+                styles[t] = (0, 255, 0)
+            styles[chosentriangle] = (255, 0, 0)
+        elif action == MERGING:
+            styles[tri1] = styles[tri2] = (0, 0, 255)
+        elif action == KILL:
+            for t in killeds:
+                styles[t] = (0, 0, 0)
+        elif action == NORMALIZE:
+            styles[tri1] = (0, 0, 0)
 
         ddd = {IDLE : "semiautoplay",
                MERGING : "merging...",
                KILL : "cutting...",
                NORMALIZE : "normalizing...",
                EDITING : "editing",
-               SOLITAIRE : "solitaire"}
-
-        texty(30, 30, f'mode = {ddd[action]}')
-        texty(30, 60, f"random steps = {random_steps}")
-        texty(30, 90, f'speed = {float(speed):.4f}')
-
-    
-        pygame.display.flip()
-
-
-if __name__ == '__main__': main()
+               SOLITAIRE : "solitaire",
+               REPLAY : "replay"}
+
+        lines = [f'mode = {ddd[action]}',
+                 f"random steps = {random_steps}",
+                 f'speed = {float(speed):.4f}']
+        if autoplay_text != None:
+            lines.append(autoplay_text)
+        if profile_text != None:
+            lines.append(profile_text)
+        if action == REPLAY:
+            lines.append(f"move {replay.pos} / {replay.moves}" + ("" if replay_playing else " (paused)"))
+        if stats.enabled:
+            lines.extend(stats.lines())
+        if show_timings and len(timings) > 0:
+            ev, sim, draw, wall, moves = (sum(t[i] for t in timings)/len(timings) for i in range(5))
+            wall = max(wall, 0.001) # clock.tick is in whole milliseconds
+            lines.append(f"frame {1000*wall:.1f} ms: events {100*ev/wall:.0f}%, simulation {100*sim/wall:.0f}%, drawing {100*draw/wall:.0f}%")
+            lines.append(f"{moves/wall:.0f} moves/s")
+        renderer.draw(dots, triangles, action not in [SOLITAIRE, EDITING, REPLAY], styles,
+                      moused_triangle if action == SOLITAIRE else None, lines)
+
+        drawing_done = time.perf_counter()
+
+        # nothing changes until there's an event: no operation, auto-play, randomization,
+        # replay or held key or mouse button
+        idle = (profiler == None and not any(keys[k] for k in HELD_KEYS) and not any(mpress)
+                and ((action in idles and autoplayer == None and not randomization)
+                     or (action == REPLAY and (not replay_playing or replay.pos >= replay.moves))))
+        frame_time = clock.tick(fps)/1000
+        # the rest of the frame is waiting for the frame limiter (or for events)
+        timings.append((events_done - frame_start, simulation_done - events_done,
+                        drawing_done - simulation_done, frame_time, frame_moves))
+        # the time of a frame that started by waiting is mostly the wait, and nothing
+        # moved then, so the next frame is just one tick
+        if waited:
+            frame_time = 1/SPEED_FPS
+
+
+# python triangle_solitaire.py autoplay [--stats statsfile] [size [seed [logfile]]]
+# auto-play with no display, on a random board: each point of the triangle of that size
+# (AUTOPLAY_SIZE by default) is a dot with probability 1/2. the moves go to
+# logfile (a movelog) if it's given, and the stats counters to statsfile (as JSON)
+def autoplay_main(args):
+    statsfile = None
+    if args[:1] == ["--stats"]:
+        statsfile = args[1]
+        args = args[2:]
+        stats.enable()
+    n = int(args[0]) if len(args) > 0 else AUTOPLAY_SIZE
+    rng = random.Random(int(args[1]) if len(args) > 1 and args[1] != "-" else None)
+    dots = Board([(x, y) for x in range(n) for y in range(n - x) if rng.random() < 0.5])
+    log = None
+    if len(args) > 2:
+        log = movelog.MoveLog(args[2], "h" if n < 2048 else "i")
+    count, secs, triangles = autoplay(dots, log)
+    if log != None:
+        log.close()
+    print(f"{len(dots)} dots, n = {n}: {count} moves ({count/n**3:.3f} n^3) in {secs:.2f} s, {len(triangles)} triangles left")
+    if statsfile != None:
+        stats.dump(statsfile)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    fps = FPS
+    while args[:1] == ["--fps"] or args[:1] == ["--seed"]:
+        if args[0] == "--fps":
+            fps = int(args[1])
+        else:
+            # the randomization (and the random walk, seeded from this) is the same every time
+            random.seed(int(args[1]))
+        args = args[2:]
+    if args[:1] == ["autoplay"]:
+        autoplay_main(args[1:])
+    elif args[:1] == ["--log"]:
+        main(args[1], fps = fps)
+    elif args[:1] == ["--replay"]:
+        main(replayfile = args[1], fps = fps)
+    else:
+        main(fps = fps)
 
 
 